@@ -1,84 +1,22 @@
 from __future__ import annotations
 
-from dataclasses import dataclass, field
+from dataclasses import replace
 from pathlib import Path
+import multiprocessing
 import threading
 from tkinter import Tk, Toplevel, Frame, Label, Entry, Button, Text, StringVar, Canvas
 from tkinter import filedialog, messagebox
 from tkinter import ttk
-from typing import Optional
-import json
-import os
-from datetime import datetime
-import numpy as np
 
-from main import from_csv_to_kml_configurated
+from main import (async_writer, from_csv_to_kml_configurated, warm_imports, enable_profiling,
+                  pop_profile_reports, format_preview, format_report, preview_csv, write_profile_report)
+from progress import Cancelled, Interrupted, ProgressReporter, ProgressState, describe, reporting
+from settings import (AppConfig, SprayConfig, csv_options, csv_params, load_config, parse_bounds,
+                      parse_int_list, parse_timeout, save_config)
+from spray import apply_global_scale, preview_spray_file, process_spray_file
 
-
-@dataclass
-class AppConfig:
-    """Application configuration settings."""
-    levels: int = 400
-    variable: str = 'Odor'
-    zone: str = '32'
-    projin: str = 'utm'
-    projout: str = 'WGS84'
-    static: bool = False
-    max_scale: int = 130
-    min_scale: int = 0
-    x_col: str = 'x_km'
-    y_col: str = 'y_km'
-    val_col: str = 'value'
-    scale: float = 1.0
-    base: Optional[str] = None
-    x_shift: float = 0.0
-    y_shift: float = 0.0
-    x_scale_factor: float = 1.0
-    y_scale_factor: float = 1.0
-    file_list: list[str] = field(default_factory=list)
-    config_window_open: bool = False
-
-
-@dataclass
-class SprayConfig:
-    """Spray .nc file configuration settings."""
-    specie: int = 0  # NO2 = 0, PM10 = 1
-    level: int = 0
-    tot_specie: int = 4
-    cut_map: bool = False
-    lat_min: float = 44.371366
-    lat_max: float = 44.492199
-    lon_min: float = 8.807603
-    lon_max: float = 9.039093
-    easting_start: int = 484671
-    northing_start: int = 4913138
-    easting_end: int = 503097
-    northing_end: int = 4926569
-    zone : str = '32'
-    norm_value: bool = False
-    cut_date: bool = False
-    date: str = '2024-12-17 15:00'
-    date_after_good: str = '2024-12-17 15:00'
-    colors: str = 'log'  # 'norm' or 'log'
-    kml_output: bool = True
-    kml_output_dir: str = 'kml_output'
-    scale_output: bool = True
-    scale_orientation: str = 'vertical'  # 'horizontal' or 'vertical'
-    multiplier: float = 1.0
-    # KML generation parameters
-    kml_levels: int = 400
-    kml_variable: str = 'Spray'
-    kml_static: bool = False
-    kml_max_scale: int = 100
-    kml_min_scale: int = 0
-    kml_scale: float = 1.0
-    kml_x_shift: float = 0.0
-    kml_y_shift: float = 0.0
-    kml_x_scale_factor: float = 1.0
-    kml_y_scale_factor: float = 1.0
-    file_list: list[str] = field(default_factory=list)
-    spray_config_window_open: bool = False
-    kml_config_window_open: bool = False
+# Lines kept in the log widgets during a run
+LOG_LINES = 2000
 
 
 def show_error(parent: Tk | Toplevel, message: str) -> None:
@@ -94,44 +32,8 @@ def save_spray_config_to_file(config: SprayConfig, parent: Tk | Toplevel) -> Non
         title="Save Spray Configuration"
     )
     if filename:
-        config_dict = {
-            'specie': config.specie,
-            'level': config.level,
-            'tot_specie': config.tot_specie,
-            'cut_map': config.cut_map,
-            'lat_min': config.lat_min,
-            'lat_max': config.lat_max,
-            'lon_min': config.lon_min,
-            'lon_max': config.lon_max,
-            'easting_start': config.easting_start,
-            'northing_start': config.northing_start,
-            'easting_end': config.easting_end,
-            'northing_end': config.northing_end,
-            'zone': config.zone,
-            'norm_value': config.norm_value,
-            'cut_date': config.cut_date,
-            'date': config.date,
-            'date_after_good': config.date_after_good,
-            'colors': config.colors,
-            'kml_output': config.kml_output,
-            'kml_output_dir': config.kml_output_dir,
-            'scale_output': config.scale_output,
-            'scale_orientation': config.scale_orientation,
-            'multiplier': config.multiplier,
-            'kml_levels': config.kml_levels,
-            'kml_variable': config.kml_variable,
-            'kml_static': config.kml_static,
-            'kml_max_scale': config.kml_max_scale,
-            'kml_min_scale': config.kml_min_scale,
-            'kml_scale': config.kml_scale,
-            'kml_x_shift': config.kml_x_shift,
-            'kml_y_shift': config.kml_y_shift,
-            'kml_x_scale_factor': config.kml_x_scale_factor,
-            'kml_y_scale_factor': config.kml_y_scale_factor
-        }
         try:
-            with open(filename, 'w') as f:
-                json.dump(config_dict, f, indent=4)
+            save_config(config, filename)
             messagebox.showinfo("Success", f"Configuration saved to {Path(filename).name}", parent=parent)
         except Exception as e:
             show_error(parent, f"Failed to save configuration: {e}")
@@ -145,42 +47,7 @@ def load_spray_config_from_file(config: SprayConfig, parent: Tk | Toplevel, outp
     )
     if filename:
         try:
-            with open(filename, 'r') as f:
-                config_dict = json.load(f)
-            
-            config.specie = config_dict.get('specie', config.specie)
-            config.level = config_dict.get('level', config.level)
-            config.tot_specie = config_dict.get('tot_specie', config.tot_specie)
-            config.cut_map = config_dict.get('cut_map', config.cut_map)
-            config.lat_min = config_dict.get('lat_min', config.lat_min)
-            config.lat_max = config_dict.get('lat_max', config.lat_max)
-            config.lon_min = config_dict.get('lon_min', config.lon_min)
-            config.lon_max = config_dict.get('lon_max', config.lon_max)
-            config.easting_start = config_dict.get('easting_start', config.easting_start)
-            config.northing_start = config_dict.get('northing_start', config.northing_start)
-            config.easting_end = config_dict.get('easting_end', config.easting_end)
-            config.northing_end = config_dict.get('northing_end', config.northing_end)
-            config.zone = config_dict.get('zone', config.zone)
-            config.norm_value = config_dict.get('norm_value', config.norm_value)
-            config.cut_date = config_dict.get('cut_date', config.cut_date)
-            config.date = config_dict.get('date', config.date)
-            config.date_after_good = config_dict.get('date_after_good', config.date_after_good)
-            config.colors = config_dict.get('colors', config.colors)
-            config.kml_output = config_dict.get('kml_output', config.kml_output)
-            config.kml_output_dir = config_dict.get('kml_output_dir', config.kml_output_dir)
-            config.scale_output = config_dict.get('scale_output', config.scale_output)
-            config.scale_orientation = config_dict.get('scale_orientation', config.scale_orientation)
-            config.multiplier = config_dict.get('multiplier', config.multiplier)
-            config.kml_levels = config_dict.get('kml_levels', config.kml_levels)
-            config.kml_variable = config_dict.get('kml_variable', config.kml_variable)
-            config.kml_static = config_dict.get('kml_static', config.kml_static)
-            config.kml_max_scale = config_dict.get('kml_max_scale', config.kml_max_scale)
-            config.kml_min_scale = config_dict.get('kml_min_scale', config.kml_min_scale)
-            config.kml_scale = config_dict.get('kml_scale', config.kml_scale)
-            config.kml_x_shift = config_dict.get('kml_x_shift', config.kml_x_shift)
-            config.kml_y_shift = config_dict.get('kml_y_shift', config.kml_y_shift)
-            config.kml_x_scale_factor = config_dict.get('kml_x_scale_factor', config.kml_x_scale_factor)
-            config.kml_y_scale_factor = config_dict.get('kml_y_scale_factor', config.kml_y_scale_factor)
+            load_config(config, filename)
             
             output.insert('end', f'Loaded configuration from {Path(filename).name}\n')
             
@@ -200,11 +67,6 @@ def process_spray_files(config: SprayConfig, output: Text, root: Tk) -> None:
         messagebox.showwarning("No Files", "Please select .nc files to process first", parent=root)
         return
     
-    from netCDF4 import Dataset
-    from pyproj import Proj, Transformer
-    import tempfile
-    import pandas as pd
-    
     # Create progress window
     total_files = len(config.file_list)
     progress_window = ProgressWindow(root, total_files)
@@ -212,170 +74,112 @@ def process_spray_files(config: SprayConfig, output: Text, root: Tk) -> None:
     output.insert('end', 'Starting Spray processing...\n')
     root.update()
     
+    enable_profiling(config.profile)
+    reports = []
+    reporter = gui_reporter(root, output, progress_window)
     try:
-        for file_idx, file_path in enumerate(config.file_list, 1):
-            file_name = Path(file_path).name
-            
-            output.insert('end', f'Processing {file_name}...\n')
-            root.update()
-            
-            try:
-                # Read NetCDF file
-                ds = Dataset(file_path)
-                concentration = ds.variables['concentration'][:]
-                conc_shape = concentration.shape
-                
-                # Get dimensions
-                time_frames = conc_shape[0]
-                num_species_total = conc_shape[1]
-                num_levels = conc_shape[2]
-                nlat = conc_shape[3]
-                nlon = conc_shape[4]
-                
-                # Calculate number of sources
-                num_sources = num_species_total // config.tot_specie
-                
-                # Get lat/lon grid from UTM coordinates
-                utm_proj = Proj(proj='utm', zone=int(config.zone), ellps='WGS84')
-                geo_proj = Proj(proj='latlong', datum='WGS84')
-                transformer = Transformer.from_proj(utm_proj, geo_proj)
-                
-                lon_start, lat_start = transformer.transform(config.easting_start, config.northing_start)
-                lon_end, lat_end = transformer.transform(config.easting_end, config.northing_end)
-                
-                latitudes = np.linspace(lat_start, lat_end, nlat)
-                longitudes = np.linspace(lon_start, lon_end, nlon)
-                
-                # Create output directory
-                os.makedirs(config.kml_output_dir, exist_ok=True)
-                
-                # Get start time
-                start_time = datetime.strptime(config.date, '%Y-%m-%d %H:%M').timestamp()
-                good_time = datetime.strptime(config.date_after_good, '%Y-%m-%d %H:%M').timestamp()
-                
-                # Apply subsetting to lat/lon if needed
-                if config.cut_map:
-                    lat_inds = [i for i, lat in enumerate(latitudes) if config.lat_min <= lat <= config.lat_max]
-                    lon_inds = [j for j, lon in enumerate(longitudes) if config.lon_min <= lon <= config.lon_max]
-                    if not lat_inds or not lon_inds:
-                        raise ValueError('No grid points found within the specified lat/lon bounds')
-                    i_start, i_end = min(lat_inds), max(lat_inds)
-                    j_start, j_end = min(lon_inds), max(lon_inds)
-                    latitudes = latitudes[i_start:i_end+1]
-                    longitudes = longitudes[j_start:j_end+1]
-                    lat_slice = slice(i_start, i_end+1)
-                    lon_slice = slice(j_start, j_end+1)
-                else:
-                    lat_slice = slice(None)
-                    lon_slice = slice(None)
-                
-                # Get species indices
-                idxs = [config.specie + i * config.tot_specie for i in range(num_sources)]
-                
-                # Process each time frame
-                output.insert('end', f'Processing {time_frames} time frames...\n')
-                root.update()
-                
-                for t in range(time_frames):
-                    timestamp = start_time + t * 3600
-                    readable_time = datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M')
-                    
-                    # Update progress
-                    progress_window.update_progress(file_idx, f'{file_name} - Frame {t+1}/{time_frames}')
-                    
-                    # Skip if before good time
-                    if config.cut_date and timestamp < good_time:
-                        continue
-                    
-                    # Aggregate concentrations from all sources (using same logic as cut_filer_json_kml.py)
-                    grid = concentration[t][idxs[0]][config.level][lat_slice, lon_slice].copy()
-                    for k in idxs[1:]:
-                        grid += concentration[t][k][config.level][lat_slice, lon_slice]
-                    
-                    lats_subset = latitudes
-                    lons_subset = longitudes
-                    
-                    # Create temporary CSV file with ALL grid points (CSV engine needs complete grid)
-                    csv_data = []
-                    has_nonzero = False
-                    for i in range(len(lats_subset)):
-                        for j in range(len(lons_subset)):
-                            value = float(grid[i, j]) * config.multiplier
-                            if value > 0:
-                                has_nonzero = True
-                            csv_data.append({
-                                'x_km': lons_subset[j],
-                                'y_km': lats_subset[i],
-                                'value': value
-                            })
-                    
-                    # Skip frames with no data
-                    if not has_nonzero:
-                        continue
-                    
-                    # Create temporary CSV file
-                    with tempfile.NamedTemporaryFile(mode='w', suffix='.csv', delete=False, newline='') as tmp_csv:
-                        df = pd.DataFrame(csv_data)
-                        df.to_csv(tmp_csv.name, index=False)
-                        temp_csv_path = tmp_csv.name
-                    
-                    try:
-                        # Use CSV to KML converter with WGS84 coordinates
-                        params = (
-                            config.kml_levels,  # levels
-                            config.kml_variable,  # variable
-                            config.zone,  # zone (not used for latlong)
-                            'latlong',  # projin - geographic coordinates
-                            'WGS84',  # projout
-                            config.kml_static,  # static
-                            config.kml_max_scale,  # max_scale
-                            config.kml_min_scale,  # min_scale
-                            'x_km',  # x_col
-                            'y_km',  # y_col
-                            'value',  # val_col
-                            config.kml_scale,  # scale
-                            config.kml_output_dir,  # base output directory
-                            config.kml_x_shift,  # x_shift
-                            config.kml_y_shift,  # y_shift
-                            config.kml_x_scale_factor,  # x_scale_factor
-                            config.kml_y_scale_factor   # y_scale_factor
-                        )
-                        
-                        base_name = Path(file_path).stem
-                        # Generate KML
-                        new_kml =  new_kml = Path(config.kml_output_dir) / f'{base_name}_{config.kml_variable}_{readable_time}.kml'
-                        from_csv_to_kml_configurated(temp_csv_path, params, new_kml)
-                        
+        with async_writer() as writer, reporting(reporter):
+            # The scanned scale is only for this batch, the settings are left as they are
+            batch_config = config
+            if config.auto_scale:
+                scanned = replace(config)
+                try:
+                    reporter.log(apply_global_scale(scanned, config.file_list).rstrip('\n'))
+                    batch_config = scanned
+                except Exception as e:
+                    reporter.log(f'✗ Pre-scan failed, the configured scale is kept: {e}')
+            for file_idx, file_path in enumerate(config.file_list, 1):
+                file_name = Path(file_path).name
+                writer.source = file_path
 
-                        
-                    finally:
-                        # Clean up temporary CSV
-                        if os.path.exists(temp_csv_path):
-                            os.unlink(temp_csv_path)
-                
-                ds.close()
-                output.insert('end', f'✓ Completed {file_name}\n')
-                
-            except Exception as e:
-                import traceback
-                output.insert('end', f'✗ Error in {file_name}: {e}\n')
-                output.insert('end', f'{traceback.format_exc()}\n')
-            finally:
-                root.update()
-        
-        output.insert('end', 'All Spray files processed!\n')
+                try:
+                    reporter.start_file(file_path, file_idx, total_files, config.file_timeout)
+                    reporter.log(f'Processing {file_name}...')
+                    process_spray_file(batch_config, file_path)
+                    reporter.log(f'✓ Completed {file_name}')
+                except Interrupted as e:
+                    reporter.record(e)
+                    reporter.log(f'✗ {file_name}: {e}')
+                    if isinstance(e, Cancelled):
+                        break
+                except Exception as e:
+                    import traceback
+                    reporter.log(f'✗ Error in {file_name}: {e}')
+                    reporter.log(traceback.format_exc().rstrip('\n'))
+                finally:
+                    report_write_errors(writer, reporter.log)
+                    for report in pop_profile_reports():
+                        reporter.log(format_report(report).rstrip('\n'))
+                        reports.append(report)
+
+        report_write_errors(writer, lambda message: append_log(output, [message]))
+        report_incomplete(reporter, output)
+        output.insert('end', 'Spray processing cancelled\n' if reporter.cancelled else 'All Spray files processed!\n')
+        save_profile_report(config.profile_report, reports, output)
     finally:
+        enable_profiling(False)
         # Close progress window
         progress_window.close()
         config.file_list.clear()
 
 
+def report_write_errors(writer, log) -> None:
+    """Log the failed background writes against the input file they belong to."""
+    for source, path, e in writer.pop_errors():
+        log(f'✗ Error in {Path(source).name}: failed to write {Path(path).name}: {e}')
+
+
+def report_incomplete(reporter: ProgressReporter, output: Text) -> None:
+    """Summarise the files and frames given up on by cancellation or timeouts."""
+    if not reporter.incomplete:
+        return
+    lines = [f'{len(reporter.incomplete)} item(s) not converted:']
+    for file, frame, item, reason in reporter.incomplete:
+        where = Path(file).name if frame is None else f'{Path(file).name} frame {frame}'
+        if item is not None:
+            where += f' ({item})'
+        lines.append(f'  {where}: {reason}')
+    append_log(output, lines)
+
+
+def append_log(output: Text, messages: list[str]) -> None:
+    """Append messages to a log widget, keeping only the last LOG_LINES lines."""
+    output.insert('end', ''.join(f'{message}\n' for message in messages))
+    excess = int(output.index('end-1c').split('.')[0]) - 1 - LOG_LINES
+    if excess > 0:
+        output.delete('1.0', f'{excess + 1}.0')
+
+
+def gui_reporter(root: Tk, output: Text, progress_window: 'ProgressWindow') -> ProgressReporter:
+    """Build a progress reporter refreshing the progress window and the log widget."""
+    def on_log(messages: list[str]) -> None:
+        append_log(output, messages)
+        root.update()
+
+    # Conversions run on the Tk thread, so every cancellation point also handles pending events
+    reporter = ProgressReporter(on_progress=progress_window.show, on_log=on_log, on_idle=root.update,
+                                log_size=LOG_LINES)
+    progress_window.bind_reporter(reporter)
+    return reporter
+
+
+def save_profile_report(path: str | None, reports: list[dict], output: Text) -> None:
+    """Write the profiling reports of a run to JSON when a report path is configured."""
+    if not path or not reports:
+        return
+    try:
+        write_profile_report(path, reports)
+        output.insert('end', f'Profile report written to {path}\n')
+    except OSError as e:
+        output.insert('end', f'✗ Failed to write profile report: {e}\n')
+
+
 class ProgressWindow:
     """Progress window with progress bar."""
     def __init__(self, parent: Tk, total_files: int):
         self.window = Toplevel(parent)
         self.window.title("Processing...")
-        self.window.geometry("380x190")
+        self.window.geometry("380x220")
         self.window.configure(bg='#1e1e1e')
         self.window.transient(parent)
         self.window.grab_set()
@@ -384,8 +188,8 @@ class ProgressWindow:
         # Center the window
         self.window.update_idletasks()
         x = (self.window.winfo_screenwidth() // 2) - (380 // 2)
-        y = (self.window.winfo_screenheight() // 2) - (140 // 2)
-        self.window.geometry(f'380x140+{x}+{y}')
+        y = (self.window.winfo_screenheight() // 2) - (180 // 2)
+        self.window.geometry(f'380x180+{x}+{y}')
         
         # Main frame
         main_frame = Frame(self.window, bg='#1e1e1e', padx=18, pady=18)
@@ -438,9 +242,36 @@ class ProgressWindow:
         )
         self.progress_text.pack()
         
+        # Skip / cancel buttons, active once a reporter is bound
+        button_frame = Frame(main_frame, bg='#1e1e1e')
+        button_frame.pack(fill='x', pady=(8, 0))
+        self.skip_button = Button(button_frame, text="⏭ Skip File", state='disabled',
+                                  bg='#3d3d3d', fg='#E0E0E0', font=('Segoe UI', 8, 'bold'), relief='flat',
+                                  padx=10, pady=4, cursor='hand2', activebackground='#4d4d4d')
+        self.skip_button.pack(side='left', fill='x', expand=True, padx=(0, 3))
+        self.cancel_button = Button(button_frame, text="✖ Cancel", state='disabled',
+                                    bg='#C62828', fg='white', font=('Segoe UI', 8, 'bold'), relief='flat',
+                                    padx=10, pady=4, cursor='hand2', activebackground='#B71C1C')
+        self.cancel_button.pack(side='left', fill='x', expand=True, padx=(3, 0))
+        
         self.total_files = total_files
         self.current = 0
     
+    def bind_reporter(self, reporter: ProgressReporter):
+        """Let the buttons and the close box skip the current file or cancel the run."""
+        def cancel():
+            reporter.cancel()
+            self.cancel_button.config(state='disabled', text="Cancelling...")
+            self.skip_button.config(state='disabled')
+
+        self.skip_button.config(state='normal', command=reporter.skip)
+        self.cancel_button.config(state='normal', command=cancel)
+        self.window.protocol('WM_DELETE_WINDOW', cancel)
+    
+    def show(self, state: ProgressState):
+        """Show the file, frame and level of a progress state."""
+        self.update_progress(state.file_index, describe(state))
+
     def update_progress(self, current: int, filename: str):
         """Update progress bar and status."""
         self.current = current
@@ -478,7 +309,29 @@ def collect_data(config: AppConfig, var_data: list[str], window: Toplevel, outpu
     config.x_col = var_data[7]
     config.y_col = var_data[8]
     config.val_col = var_data[9]
-    config.base = var_data[10] if var_data[10] else None
+    try:
+        config.clip_bounds = parse_bounds(var_data[10])
+    except ValueError as e:
+        show_error(window, f'Clip Bounds: {e}')
+        return
+    config.clip_crs = var_data[11]
+    config.auto_crop = var_data[12] == 'True'
+    try:
+        config.file_timeout = parse_timeout(var_data[13])
+    except ValueError as e:
+        show_error(window, f'File Timeout: {e}')
+        return
+    if var_data[14] not in ('vector', 'raster'):
+        show_error(window, 'Output Mode must be vector or raster')
+        return
+    config.output_mode = var_data[14]
+    config.shared_styles = var_data[15] == 'True'
+    config.float32 = var_data[16] == 'True'
+    config.stream_row_groups = var_data[17] == 'True'
+    config.value_columns = [column.strip() for column in var_data[18].split(',') if column.strip()]
+    config.profile = var_data[19] == 'True'
+    config.profile_report = var_data[20] if var_data[20] else None
+    config.base = var_data[21] if var_data[21] else None
     config.config_window_open = False
     
     window.destroy()
@@ -489,7 +342,7 @@ def open_configuration(root: Tk, config: AppConfig, output: Text) -> None:
     config.config_window_open = True
     config_window = Toplevel(root)
     config_window.title('⚙️ Configuration Settings')
-    config_window.geometry("480x580")
+    config_window.geometry("480x720")
     config_window.configure(bg='#1e1e1e')
     config_window.resizable(False, False)
     
@@ -511,9 +364,25 @@ def open_configuration(root: Tk, config: AppConfig, output: Text) -> None:
     )
     title.pack(pady=10)
 
-    # Configuration fields with card-like container
-    fields_frame = Frame(main_frame, bg='#1e1e1e')
-    fields_frame.pack(fill='both', expand=True)
+    # Configuration fields in a scrollable container, so the buttons stay on screen
+    fields_container = Frame(main_frame, bg='#1e1e1e')
+    fields_container.pack(fill='both', expand=True)
+    canvas = Canvas(fields_container, bg='#1e1e1e', highlightthickness=0, height=400)
+    scrollbar = ttk.Scrollbar(fields_container, orient='vertical', command=canvas.yview)
+    fields_frame = Frame(canvas, bg='#1e1e1e')
+
+    fields_frame.bind('<Configure>', lambda e: canvas.configure(scrollregion=canvas.bbox('all')))
+    fields_window = canvas.create_window((0, 0), window=fields_frame, anchor='nw')
+    canvas.bind('<Configure>', lambda e: canvas.itemconfigure(fields_window, width=e.width))
+    canvas.configure(yscrollcommand=scrollbar.set)
+
+    canvas.pack(side='left', fill='both', expand=True)
+    scrollbar.pack(side='right', fill='y')
+
+    # Mouse wheel scrolling
+    def on_mousewheel(event):
+        canvas.yview_scroll(int(-1*(event.delta/120)), "units")
+    canvas.bind_all("<MouseWheel>", on_mousewheel)
     
     fields = [
         ('Levels:', str(config.levels)),
@@ -526,6 +395,17 @@ def open_configuration(root: Tk, config: AppConfig, output: Text) -> None:
         ('X Column:', config.x_col),
         ('Y Column:', config.y_col),
         ('Value Column:', config.val_col),
+        ('Clip Bounds:', ', '.join(str(v) for v in config.clip_bounds or [])),
+        ('Clip CRS (input/wgs84):', config.clip_crs),
+        ('Auto Crop:', str(config.auto_crop)),
+        ('File Timeout (s):', str(config.file_timeout or '')),
+        ('Output Mode (vector/raster):', config.output_mode),
+        ('Shared Styles:', str(config.shared_styles)),
+        ('Float32 Values:', str(config.float32)),
+        ('Stream Row Groups:', str(config.stream_row_groups)),
+        ('Value Columns:', ', '.join(config.value_columns)),
+        ('Profile Stages:', str(config.profile)),
+        ('Profile Report:', config.profile_report or ''),
     ]
     
     entries = []
@@ -646,7 +526,7 @@ def open_kml_configuration(root: Tk, config: SprayConfig, output: Text) -> None:
     config.kml_config_window_open = True
     kml_window = Toplevel(root)
     kml_window.title('🎨 KML Generation Settings')
-    kml_window.geometry("480x520")
+    kml_window.geometry("480x740")
     kml_window.configure(bg='#1e1e1e')
     kml_window.resizable(False, False)
     
@@ -683,6 +563,12 @@ def open_kml_configuration(root: Tk, config: SprayConfig, output: Text) -> None:
         ('Y Shift:', str(config.kml_y_shift)),
         ('X Scale Factor:', str(config.kml_x_scale_factor)),
         ('Y Scale Factor:', str(config.kml_y_scale_factor)),
+        ('Auto Crop (True/False):', str(config.auto_crop)),
+        ('Output Mode (vector/raster):', config.output_mode),
+        ('Shared Styles (True/False):', str(config.shared_styles)),
+        ('Float32 Values (True/False):', str(config.float32)),
+        ('Profile Stages (True/False):', str(config.profile)),
+        ('Profile Report:', config.profile_report or ''),
     ]
     
     entries = []
@@ -715,13 +601,21 @@ def open_kml_configuration(root: Tk, config: SprayConfig, output: Text) -> None:
             config.kml_levels = int(entries[0].get())
             config.kml_variable = entries[1].get()
             config.kml_static = entries[2].get() == 'True'
-            config.kml_max_scale = int(entries[3].get())
+            config.kml_max_scale = float(entries[3].get())
             config.kml_min_scale = int(entries[4].get())
             config.kml_scale = float(entries[5].get())
             config.kml_x_shift = float(entries[6].get())
             config.kml_y_shift = float(entries[7].get())
             config.kml_x_scale_factor = float(entries[8].get())
             config.kml_y_scale_factor = float(entries[9].get())
+            config.auto_crop = entries[10].get() == 'True'
+            if entries[11].get() not in ('vector', 'raster'):
+                raise ValueError('Output Mode must be vector or raster')
+            config.output_mode = entries[11].get()
+            config.shared_styles = entries[12].get() == 'True'
+            config.float32 = entries[13].get() == 'True'
+            config.profile = entries[14].get() == 'True'
+            config.profile_report = entries[15].get() or None
             config.kml_config_window_open = False
             kml_window.destroy()
             output.insert('end', 'Loaded KML Configuration\n')
@@ -771,7 +665,7 @@ def open_spray_configuration(root: Tk, config: SprayConfig, output: Text) -> Non
     config.spray_config_window_open = True
     config_window = Toplevel(root)
     config_window.title('🌫️ Spray Configuration')
-    config_window.geometry("640x580")
+    config_window.geometry("640x705")
     config_window.configure(bg='#1e1e1e')
     config_window.resizable(False, False)
     
@@ -928,6 +822,19 @@ def open_spray_configuration(root: Tk, config: SprayConfig, output: Text) -> Non
         ('KML Output:', str(config.kml_output), 1, 0),
         ('Scale Output:', str(config.scale_output), 1, 2),
         ('Orientation:', config.scale_orientation, 2, 0),
+        ('Prefetch:', str(config.prefetch_frames), 2, 2),
+        ('File Timeout:', str(config.file_timeout or ''), 3, 0),
+        ('Frame Timeout:', str(config.frame_timeout or ''), 3, 2),
+        ('Species List:', ', '.join(map(str, config.species)), 4, 0),
+        ('Levels List:', ', '.join(map(str, config.vertical_levels)), 4, 2),
+        ('Reductions:', ', '.join(config.reductions), 5, 0),
+        ('Window (h):', str(config.reduction_window), 5, 2),
+        ('Percentile:', str(config.percentile), 6, 0),
+        ('Threshold:', str(config.reduction_threshold), 6, 2),
+        ('Auto Scale:', config.auto_scale, 7, 0),
+        ('Reuse Frames:', str(config.reuse_frames), 7, 2),
+        ('Frame Quantum:', str(config.frame_quantum), 8, 0),
+        ('Specie Names:', ', '.join(config.specie_names), 8, 2),
     ]
     
     for label_text, default_value, row, col in fields_row5:
@@ -987,6 +894,23 @@ def open_spray_configuration(root: Tk, config: SprayConfig, output: Text) -> Non
             config.kml_output = entries[19].get() == 'True'
             config.scale_output = entries[20].get() == 'True'
             config.scale_orientation = entries[21].get()
+            config.prefetch_frames = int(entries[22].get())
+            config.file_timeout = parse_timeout(entries[23].get())
+            config.frame_timeout = parse_timeout(entries[24].get())
+            config.species = parse_int_list(entries[25].get())
+            config.vertical_levels = parse_int_list(entries[26].get())
+            config.reductions = [name.strip() for name in entries[27].get().split(',') if name.strip()]
+            if set(config.reductions) - {'mean', 'max', 'percentile', 'hours_above'}:
+                raise ValueError('Reductions must be mean, max, percentile or hours_above')
+            config.reduction_window = int(entries[28].get())
+            config.percentile = float(entries[29].get())
+            config.reduction_threshold = float(entries[30].get())
+            config.auto_scale = entries[31].get().strip()
+            config.reuse_frames = entries[32].get() == 'True'
+            config.frame_quantum = float(entries[33].get())
+            config.specie_names = [name.strip() for name in entries[34].get().split(',')]
+            if config.specie_names == ['']:
+                config.specie_names = []
             config.kml_output_dir = folder_entry.get()
             config.spray_config_window_open = False
             config_window.destroy()
@@ -1018,6 +942,19 @@ def open_spray_configuration(root: Tk, config: SprayConfig, output: Text) -> Non
         entries[19].delete(0, 'end'); entries[19].insert(0, str(config.kml_output))
         entries[20].delete(0, 'end'); entries[20].insert(0, str(config.scale_output))
         entries[21].delete(0, 'end'); entries[21].insert(0, config.scale_orientation)
+        entries[22].delete(0, 'end'); entries[22].insert(0, str(config.prefetch_frames))
+        entries[23].delete(0, 'end'); entries[23].insert(0, str(config.file_timeout or ''))
+        entries[24].delete(0, 'end'); entries[24].insert(0, str(config.frame_timeout or ''))
+        entries[25].delete(0, 'end'); entries[25].insert(0, ', '.join(map(str, config.species)))
+        entries[26].delete(0, 'end'); entries[26].insert(0, ', '.join(map(str, config.vertical_levels)))
+        entries[27].delete(0, 'end'); entries[27].insert(0, ', '.join(config.reductions))
+        entries[28].delete(0, 'end'); entries[28].insert(0, str(config.reduction_window))
+        entries[29].delete(0, 'end'); entries[29].insert(0, str(config.percentile))
+        entries[30].delete(0, 'end'); entries[30].insert(0, str(config.reduction_threshold))
+        entries[31].delete(0, 'end'); entries[31].insert(0, config.auto_scale)
+        entries[32].delete(0, 'end'); entries[32].insert(0, str(config.reuse_frames))
+        entries[33].delete(0, 'end'); entries[33].insert(0, str(config.frame_quantum))
+        entries[34].delete(0, 'end'); entries[34].insert(0, ', '.join(config.specie_names))
         folder_entry.delete(0, 'end'); folder_entry.insert(0, config.kml_output_dir)
     
     # Separator
@@ -1207,44 +1144,66 @@ def main() -> None:
         csv_output.insert('end', 'Starting processing...\n')
         root.update()
         
+        enable_profiling(config.profile)
+        reports = []
+        reporter = gui_reporter(root, csv_output, progress_window)
         try:
-            for idx, file_path in enumerate(config.file_list, 1):
-                file_name = Path(file_path).name
-                
-                # Update progress window
-                progress_window.update_progress(idx, file_name)
-                
-                csv_output.insert('end', f'Processing {file_name}...\n')
-                root.update()
-                
-                try:
-                    params = (
-                        config.levels, config.variable, config.zone, 
-                        config.projin, config.projout, config.static, 
-                        config.max_scale, config.min_scale, config.x_col, 
-                        config.y_col, config.val_col, config.scale,
-                        config.base, config.x_shift, config.y_shift,
-                        config.x_scale_factor, config.y_scale_factor
-                    )
-                    from_csv_to_kml_configurated(file_path, params)
-                    csv_output.insert('end', f'✓ Completed {file_name}\n')
-                except Exception as e:
-                    csv_output.insert('end', f'✗ Error in {file_name}: {e}\n')
-                finally:
-                    root.update()
-            
-            csv_output.insert('end', 'All files processed!\n')
+            with async_writer() as writer, reporting(reporter):
+                for idx, file_path in enumerate(config.file_list, 1):
+                    file_name = Path(file_path).name
+                    writer.source = file_path
+
+                    try:
+                        reporter.start_file(file_path, idx, total_files, config.file_timeout)
+                        reporter.log(f'Processing {file_name}...')
+                        from_csv_to_kml_configurated(file_path, csv_params(config), **csv_options(config))
+                        reporter.log(f'✓ Completed {file_name}')
+                    except Interrupted as e:
+                        reporter.record(e)
+                        reporter.log(f'✗ {file_name}: {e}')
+                        if isinstance(e, Cancelled):
+                            break
+                    except Exception as e:
+                        reporter.log(f'✗ Error in {file_name}: {e}')
+                    finally:
+                        report_write_errors(writer, reporter.log)
+                        for report in pop_profile_reports():
+                            reporter.log(format_report(report).rstrip('\n'))
+                            reports.append(report)
+
+            report_write_errors(writer, lambda message: append_log(csv_output, [message]))
+            report_incomplete(reporter, csv_output)
+            csv_output.insert('end', 'Processing cancelled\n' if reporter.cancelled else 'All files processed!\n')
+            save_profile_report(config.profile_report, reports, csv_output)
         finally:
+            enable_profiling(False)
             # Close progress window
             progress_window.close()
             config.file_list.clear()
     
+    def preview_selected():
+        """Write a coarse preview of the last selected CSV file and log its extent and values."""
+        if config.config_window_open:
+            csv_output.insert('end', 'Configuration open, load configuration first\n')
+            return
+        if not config.file_list:
+            messagebox.showwarning("No Files", "Please select files to preview first", parent=root)
+            return
+        file_path = config.file_list[-1]
+        csv_output.insert('end', f'Previewing {Path(file_path).name}...\n')
+        root.update()
+        try:
+            csv_output.insert('end', format_preview(preview_csv(file_path, csv_params(config))))
+        except Exception as e:
+            csv_output.insert('end', f'✗ Error in {Path(file_path).name}: {e}\n')
+    
     def select_files():
         """Open file dialog to select CSV files."""
         filenames = filedialog.askopenfilenames(
             initialdir="/",
             title="Select CSV Files",
-            filetypes=[("CSV Files", "*.csv"), ("All Files", "*.*")]
+            filetypes=[("CSV Files", "*.csv"), ("Parquet/Feather Files", "*.parquet *.feather"),
+                       ("Grid Files", "*.npy *.npz *.bin *.raw"), ("All Files", "*.*")]
         )
         if filenames:
             config.file_list.extend(filenames)
@@ -1283,6 +1242,22 @@ def main() -> None:
     )
     select_btn.pack(side='left', fill='x', expand=True, padx=(0, 6))
     
+    preview_btn = Button(
+        csv_button_frame1, 
+        text="🔍 Preview",
+        command=preview_selected,
+        bg='#5E35B1',
+        fg='white',
+        font=('Segoe UI', 9, 'bold'),
+        relief='flat',
+        padx=15,
+        pady=9,
+        cursor='hand2',
+        activebackground='#512DA8',
+        activeforeground='white'
+    )
+    preview_btn.pack(side='left', fill='x', expand=True, padx=(6, 6))
+    
     clear_btn = Button(
         csv_button_frame1, 
         text="🗑️ Clear",
@@ -1426,6 +1401,26 @@ def main() -> None:
         spray_config.file_list.clear()
         spray_output.insert('end', 'Spray output cleared\n')
     
+    def preview_spray_selected():
+        """Write a coarse preview of the last selected .nc file and log its extent and values."""
+        if spray_config.spray_config_window_open or spray_config.kml_config_window_open:
+            spray_output.insert('end', 'Configuration open, load configuration first\n')
+            return
+        if not spray_config.file_list:
+            messagebox.showwarning("No Files", "Please select .nc files to preview first", parent=root)
+            return
+        file_path = spray_config.file_list[-1]
+        spray_output.insert('end', f'Previewing {Path(file_path).name}...\n')
+        root.update()
+        try:
+            summary = preview_spray_file(spray_config, file_path)
+            if summary is None:
+                spray_output.insert('end', f'  {Path(file_path).name}: no frame above the minimum scale\n')
+            else:
+                spray_output.insert('end', format_preview(summary))
+        except Exception as e:
+            spray_output.insert('end', f'✗ Error in {Path(file_path).name}: {e}\n')
+    
     def start_spray_processing():
         """Start processing the selected spray files."""
         if spray_config.spray_config_window_open:
@@ -1496,7 +1491,7 @@ def main() -> None:
     )
     spray_start_btn.pack(side='left', fill='x', expand=True, padx=(4, 0))
     
-    # Seconda riga: Spray Config, KML Settings, (spazio vuoto o altro)
+    # Seconda riga: Spray Config, KML Settings, Preview
     spray_button_frame2 = Frame(spray_actions_content, bg=CARD_BG)
     spray_button_frame2.pack(fill='x')
     
@@ -1530,7 +1525,23 @@ def main() -> None:
         activebackground='#512DA8',
         activeforeground='white'
     )
-    kml_config_btn.pack(side='left', fill='x', expand=True, padx=(4, 0))
+    kml_config_btn.pack(side='left', fill='x', expand=True, padx=(4, 4))
+    
+    spray_preview_btn = Button(
+        spray_button_frame2, 
+        text="🔍 Preview",
+        command=preview_spray_selected,
+        bg='#424242',
+        fg='white',
+        font=('Segoe UI', 8, 'bold'),
+        relief='flat',
+        padx=10,
+        pady=8,
+        cursor='hand2',
+        activebackground='#5d5d5d',
+        activeforeground='white'
+    )
+    spray_preview_btn.pack(side='left', fill='x', expand=True, padx=(4, 0))
     
     # Footer with exit button
     footer_frame = Frame(main_container, bg=BG_COLOR)
@@ -1552,7 +1563,12 @@ def main() -> None:
     )
     exit_btn.pack(fill='x')
     
+    # Load the scientific stack in the background once the window is up
+    root.after_idle(lambda: threading.Thread(target=warm_imports, daemon=True).start())
+    
     root.mainloop()
 
 if __name__ == "__main__":
+    # Frozen builds must not re-run the GUI in the column worker processes
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
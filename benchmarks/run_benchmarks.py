@@ -0,0 +1,253 @@
+"""
+Benchmarks for every stage of the CSV and Spray to KML pipeline.
+
+Synthetic plume grids (Gaussian puffs with noise and islands) are generated
+at several sizes and level counts, each pipeline stage is timed on its own
+and the results are written as JSON so runs can be compared between versions.
+
+    python benchmarks/run_benchmarks.py -o results.json
+    python benchmarks/run_benchmarks.py --sizes 100 500 --levels 50 -o new.json --compare results.json
+"""
+from __future__ import annotations
+
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import numpy as np
+
+import main
+from settings import SprayConfig
+
+DEFAULT_SIZES = [100, 250, 500, 1000, 2000]
+DEFAULT_LEVELS = [50, 400]
+# UTM kilometres around Genoa, zone 32
+ORIGIN_X = 484.0
+ORIGIN_Y = 4913.0
+EXTENT_KM = 20.0
+
+
+def synthetic_plume(size: int, seed: int = 0) -> tuple:
+    """
+    Builds a square plume grid of Gaussian puffs with noise and islands.
+
+    The noise is smooth (a few random sine modes) so the ring count stays
+    independent of the resolution, small detached puffs form islands and
+    values under a threshold are zeroed like a real dispersion output.
+
+    Returns:
+        tuple : (x axis in km, y axis in km, 2D values indexed [y, x])
+    """
+    rng = np.random.default_rng(seed)
+    xs = np.linspace(ORIGIN_X, ORIGIN_X + EXTENT_KM, size)
+    ys = np.linspace(ORIGIN_Y, ORIGIN_Y + EXTENT_KM, size)
+    X, Y = np.meshgrid(xs - ORIGIN_X, ys - ORIGIN_Y)
+    Z = np.zeros((size, size))
+    # Main puffs and small islands
+    for amplitude, spread, count in ((150, 3.0, 4), (30, 0.4, 12)):
+        for _ in range(count):
+            cx, cy = rng.uniform(0.1, 0.9, 2) * EXTENT_KM
+            sx, sy = rng.uniform(0.3, 1.0, 2) * spread
+            Z += rng.uniform(0.2, 1.0) * amplitude * np.exp(-((X - cx) ** 2 / (2 * sx ** 2)
+                                                               + (Y - cy) ** 2 / (2 * sy ** 2)))
+    noise = np.ones_like(Z)
+    for _ in range(4):
+        kx, ky = rng.uniform(0.5, 3.0, 2)
+        px, py = rng.uniform(0, 2 * np.pi, 2)
+        noise += 0.08 * np.sin(kx * X + px) * np.sin(ky * Y + py)
+    Z *= noise
+    Z[Z < 2.0] = 0.0
+    return xs, ys, Z
+
+
+def write_csv(path: str, xs, ys, Z) -> None:
+    """Writes a grid in the x_km,y_km,value layout read by load_csv_file_conf."""
+    X, Y = np.meshgrid(xs, ys)
+    data = np.column_stack([X.ravel(), Y.ravel(), Z.ravel()])
+    with open(path, 'w') as f:
+        f.write('x_km,y_km,value\n')
+        np.savetxt(f, data, delimiter=',', fmt='%.6f')
+
+
+def write_spray_nc(path: str, size: int, frames: int, seed: int = 0) -> None:
+    """Writes a Spray-like netCDF with 2 sources x 4 species and 2 vertical levels."""
+    from netCDF4 import Dataset
+
+    with Dataset(path, 'w') as ds:
+        for name, length in (('time', frames), ('species', 8), ('level', 2), ('lat', size), ('lon', size)):
+            ds.createDimension(name, length)
+        concentration = ds.createVariable('concentration', 'f4', ('time', 'species', 'level', 'lat', 'lon'))
+        for t in range(frames):
+            _, _, Z = synthetic_plume(size, seed + t)
+            for s in range(8):
+                concentration[t, s, 0] = Z / 8
+
+
+def configure(levels: int) -> None:
+    """Sets the main module globals the way from_csv_to_kml_configurated does."""
+    main.LEVELS = levels
+    main.VARIABLE = 'Odor'
+    main.NAME = 'bench'
+    main.ZONE = '32'
+    main.PROJIN = 'utm'
+    main.PROJOUT = 'WGS84'
+    main.STATIC = False
+    main.MAX_SCALE = 130
+    main.MIN_SCALE = 0
+    main.X_COL, main.Y_COL, main.VAL_COL = 'x_km', 'y_km', 'value'
+    main.SCALE = 1
+
+
+def timed(func, repeat: int) -> tuple:
+    """Runs func repeat times and returns (last result, list of wall times)."""
+    times = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return result, times
+
+
+def bench_stages(size: int, levels: int, workdir: str, repeat: int) -> list[dict]:
+    """Times each pipeline stage on one synthetic grid."""
+    configure(levels)
+    xs, ys, Z = synthetic_plume(size)
+    csv_path = os.path.join(workdir, f'plume_{size}.csv')
+    if not os.path.exists(csv_path):
+        write_csv(csv_path, xs, ys, Z)
+    kml_path = os.path.join(workdir, f'plume_{size}_{levels}.kml')
+    info = {'size': size, 'levels': levels, 'cells': size * size}
+    results = []
+
+    dataframe, times = timed(lambda: main.load_csv_file_conf(csv_path), repeat)
+    results.append({'stage': 'load_csv_file_conf', **info, 'times': times})
+
+    (geometry, list_x, list_y), times = timed(lambda: main.dataframe_contures(dataframe), repeat)
+    vertices = geometry.vertex_count
+    info['rings'] = geometry.ring_count
+    info['vertices'] = vertices
+    results.append({'stage': 'dataframe_contures', **info, 'times': times})
+
+    parents, times = timed(lambda: main.nest_rings(geometry), repeat)
+    results.append({'stage': 'nest_rings', **info, 'times': times})
+
+    # Projection of every contour vertex, as dataframe_contures does internally
+    gx, gy = np.meshgrid(xs[::max(1, size // 300)], ys[::max(1, size // 300)])
+    px = np.resize(gx.ravel(), max(vertices, 1))
+    py = np.resize(gy.ravel(), max(vertices, 1))
+    _, times = timed(lambda: main.converter_UTM_DEC(px, py), repeat)
+    results.append({'stage': 'converter_UTM_DEC', **info, 'times': times})
+
+    def write():
+        with open(kml_path, 'w') as kml_f:
+            return main.write_middle_chuncks(kml_f, geometry, parents)
+    max_scale_dyn, times = timed(write, repeat)
+    results.append({'stage': 'write_middle_chuncks', **info, 'times': times,
+                    'output_bytes': os.path.getsize(kml_path)})
+
+    lim = main.converter_UTM_DEC([xs[0], xs[-1]], [ys[0], ys[0]])
+    e_ne = (lim[0][0], lim[1][0])
+    e_nw = (lim[0][1], lim[1][1])
+    _, times = timed(lambda: main.make_scale(e_ne, e_nw, kml_path, max_scale_dyn), repeat)
+    results.append({'stage': 'make_scale', **info, 'times': times})
+    return results
+
+
+def bench_spray(size: int, levels: int, frames: int, workdir: str, repeat: int) -> dict:
+    """Times the end-to-end Spray path on a synthetic netCDF file."""
+    from spray import process_spray_file
+
+    nc_path = os.path.join(workdir, f'spray_{size}_{frames}.nc')
+    if not os.path.exists(nc_path):
+        write_spray_nc(nc_path, size, frames)
+    config = SprayConfig(kml_levels=levels, kml_output_dir=os.path.join(workdir, 'spray_out'))
+    _, times = timed(lambda: process_spray_file(config, nc_path), repeat)
+    return {'stage': 'spray_end_to_end', 'size': size, 'levels': levels, 'cells': size * size,
+            'frames': frames, 'times': times}
+
+
+def environment() -> dict:
+    """Describes the interpreter, libraries and source revision of a run."""
+    import matplotlib
+    import pandas
+    import pyproj
+
+    try:
+        revision = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                  capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'revision': revision,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'matplotlib': matplotlib.__version__,
+        'pyproj': pyproj.__version__,
+    }
+
+
+def compare(results: list[dict], baseline_file: str) -> None:
+    """Prints the speed ratio of each stage against a previous JSON report."""
+    with open(baseline_file) as f:
+        baseline = json.load(f)['results']
+    key = lambda r: (r['stage'], r['size'], r['levels'])
+    previous = {key(r): min(r['times']) for r in baseline}
+    print(f'\n{"stage":<22}{"size":>6}{"levels":>8}{"before":>10}{"after":>10}{"speedup":>9}')
+    for r in results:
+        if key(r) in previous:
+            before, after = previous[key(r)], min(r['times'])
+            print(f'{r["stage"]:<22}{r["size"]:>6}{r["levels"]:>8}{before:>10.4f}{after:>10.4f}'
+                  f'{before / after if after else float("inf"):>8.2f}x')
+
+
+def main_cli(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES, help='grid sizes (cells per side)')
+    parser.add_argument('--levels', type=int, nargs='+', default=DEFAULT_LEVELS, help='contour level counts')
+    parser.add_argument('--spray-sizes', type=int, nargs='*', default=[100, 250],
+                        help='grid sizes for the end-to-end Spray benchmark')
+    parser.add_argument('--frames', type=int, default=3, help='time frames in the synthetic netCDF')
+    parser.add_argument('--repeat', type=int, default=1, help='runs per measurement (the minimum is reported)')
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help='JSON report to write')
+    parser.add_argument('--compare', help='previous JSON report to compare against')
+    parser.add_argument('--workdir', help='folder for generated inputs (default: temporary)')
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = args.workdir or tmp
+        os.makedirs(workdir, exist_ok=True)
+        for size in args.sizes:
+            for levels in args.levels:
+                for result in bench_stages(size, levels, workdir, args.repeat):
+                    results.append(result)
+                    print(f'{result["stage"]:<22}{size:>6}{levels:>6} {min(result["times"]):.4f}s', flush=True)
+        for size in args.spray_sizes:
+            for levels in args.levels:
+                result = bench_spray(size, levels, args.frames, workdir, args.repeat)
+                results.append(result)
+                print(f'{result["stage"]:<22}{size:>6}{levels:>6} {min(result["times"]):.4f}s', flush=True)
+
+    with open(args.output, 'w') as f:
+        json.dump({'environment': environment(), 'results': results}, f, indent=2)
+    print(f'Results written to {args.output}')
+    if args.compare:
+        compare(results, args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main_cli())
@@ -0,0 +1,381 @@
+"""Headless batch converter: runs CSV and Spray conversions without tkinter."""
+from __future__ import annotations
+
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+import argparse
+import glob
+import os
+import sys
+import traceback
+
+from main import COLUMNAR_SUFFIXES, GRID_SUFFIXES
+from settings import AppConfig, SprayConfig, csv_options, csv_params, load_config
+
+SPRAY_SUFFIXES = ('.nc',)
+CSV_SUFFIXES = ('.csv',)
+
+
+def expand_inputs(inputs: list[str], recursive: bool = False) -> list[str]:
+    """
+    Expands files, glob patterns and directories into a sorted list of input files.
+
+    Directories contribute every CSV, Parquet/Feather, binary grid and .nc file they contain.
+    """
+    files = []
+    for item in inputs:
+        if os.path.isdir(item):
+            pattern = os.path.join(item, '**', '*') if recursive else os.path.join(item, '*')
+            files.extend(
+                path for path in glob.glob(pattern, recursive=recursive)
+                if os.path.isfile(path) and Path(path).suffix.lower() in CSV_SUFFIXES + COLUMNAR_SUFFIXES + GRID_SUFFIXES + SPRAY_SUFFIXES
+            )
+        elif glob.has_magic(item):
+            files.extend(path for path in glob.glob(item, recursive=recursive) if os.path.isfile(path))
+        else:
+            files.append(item)
+    # Preserve order, drop duplicates
+    return list(dict.fromkeys(os.path.normpath(path) for path in files))
+
+
+def convert_file(file_path: str, app_config: AppConfig, spray_config: SprayConfig,
+                 profile: bool = False, writer=None, index: int = 1,
+                 count: int = 1) -> tuple[str, str | None, list[dict], list[tuple]]:
+    """
+    Converts a single input file, dispatching on its extension.
+
+    With a writer (see main.async_writer) the outputs may still be queued
+    when this returns; its write errors are attributed to file_path. The
+    file and frame timeouts of the configurations are enforced through the
+    active progress reporter, or a private one when none is active.
+
+    Returns:
+        tuple : (file_path, error message or None, profiling reports,
+                 (file, frame, reason) of the frames given up on)
+    """
+    import main
+    import progress
+
+    main.enable_profiling(profile)
+    if writer is not None:
+        writer.source = file_path
+    is_spray = Path(file_path).suffix.lower() in SPRAY_SUFFIXES
+    reporter = progress.current() or progress.ProgressReporter()
+    done = len(reporter.incomplete)
+    with progress.reporting(reporter):
+        try:
+            reporter.start_file(file_path, index, count,
+                                spray_config.file_timeout if is_spray else app_config.file_timeout)
+            if not os.path.isfile(file_path):
+                raise FileNotFoundError(f'No such file: {file_path}')
+            if is_spray:
+                from spray import process_spray_file
+                process_spray_file(spray_config, file_path)
+            else:
+                if app_config.base:
+                    os.makedirs(app_config.base, exist_ok=True)
+                main.from_csv_to_kml_configurated(file_path, csv_params(app_config), **csv_options(app_config))
+            error = None
+        except progress.Interrupted as e:
+            reporter.record(e)
+            error = str(e)
+        except Exception as e:
+            error = f'{e}\n{traceback.format_exc()}'
+    skipped = [item for item in reporter.incomplete[done:] if item[1] is not None]
+    return file_path, error, main.pop_profile_reports(), skipped
+
+
+def preview_file(file_path: str, app_config: AppConfig, spray_config: SprayConfig, levels: int = 20,
+                 max_cells: int = 200, method: str = 'max') -> str:
+    """
+    Writes a coarse preview KML of one input file.
+
+    Returns:
+        str : the summary printed for the file
+    """
+    import main
+
+    if Path(file_path).suffix.lower() in SPRAY_SUFFIXES:
+        from spray import preview_spray_file
+        summary = preview_spray_file(spray_config, file_path, levels, max_cells, method)
+        if summary is None:
+            return f'  {Path(file_path).name}: no frame above the minimum scale\n'
+    else:
+        if app_config.base:
+            os.makedirs(app_config.base, exist_ok=True)
+        summary = main.preview_csv(file_path, csv_params(app_config), levels, max_cells, method)
+    return main.format_preview(summary)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog='csv_to_kml',
+        description='Convert CSV, Parquet/Feather, binary grid and Spray NetCDF files to KML without the GUI.'
+    )
+    parser.add_argument('inputs', nargs='+', help='input files, glob patterns or directories')
+    parser.add_argument('-c', '--config', help='JSON file with AppConfig settings for CSV inputs')
+    parser.add_argument('-s', '--spray-config', help='JSON file saved from the Spray configuration window')
+    parser.add_argument('-o', '--output-dir', help='output folder (overrides both configurations)')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='number of parallel worker processes')
+    parser.add_argument('-r', '--recursive', action='store_true', help='search directories and ** globs recursively')
+    parser.add_argument('--levels', type=int, help='number of contour levels')
+    parser.add_argument('--zone', help='UTM zone of the input coordinates')
+    parser.add_argument('--columns', nargs='+', metavar='COLUMN',
+                        help='write one KML and scale per value column, parsing each CSV once')
+    parser.add_argument('--column-workers', type=int, metavar='N',
+                        help='processes contouring the --columns of a file (default: one per column)')
+    parser.add_argument('--clip', type=float, nargs=4, metavar=('MIN_X', 'MAX_X', 'MIN_Y', 'MAX_Y'),
+                        help='only contour CSV data inside this box')
+    parser.add_argument('--clip-crs', choices=('input', 'wgs84'),
+                        help='coordinates of --clip: CSV input units or lon/lat (default: input)')
+    parser.add_argument('--auto-crop', action=argparse.BooleanOptionalAction,
+                        help='contour only the region above the minimum scale (default: on for Spray, off for CSV)')
+    parser.add_argument('--raster', action='store_true',
+                        help='write a colored PNG GroundOverlay packaged as .kmz instead of contour placemarks')
+    parser.add_argument('--shared-styles', action='store_true',
+                        help='write one style per used color in the KML header and reference it from the placemarks')
+    parser.add_argument('--float32', action='store_true',
+                        help='load, sum and contour grid values in single precision to halve their memory')
+    parser.add_argument('--stream-row-groups', action='store_true',
+                        help='read Parquet/Feather inputs one row group at a time to bound memory')
+    parser.add_argument('--species', type=int, nargs='+', metavar='S',
+                        help='Spray species to extract in one pass, each into its own subfolder')
+    parser.add_argument('--vertical-levels', type=int, nargs='+', metavar='L',
+                        help='Spray vertical levels to extract in one pass, each into its own subfolder')
+    parser.add_argument('--specie-names', nargs='+', metavar='NAME',
+                        help='variable name of every Spray specie index, e.g. NO2 PM10, used with --species')
+    parser.add_argument('--reduce', nargs='+', choices=('mean', 'max', 'percentile', 'hours_above'),
+                        help='write one KML per reduction and Spray time window instead of one per frame')
+    parser.add_argument('--window', type=int, metavar='HOURS',
+                        help='hours per --reduce window from midnight, 0 for the whole file (default: 24)')
+    parser.add_argument('--percentile', type=float, metavar='Q', help='percentile of --reduce percentile (default: 98)')
+    parser.add_argument('--threshold', type=float,
+                        help='scaled value counted by --reduce hours_above (default: 0)')
+    parser.add_argument('--histogram-bins', type=int, metavar='N',
+                        help='per-cell histogram bins of --reduce percentile (default: 100)')
+    parser.add_argument('--histogram-max', type=float, metavar='VALUE',
+                        help='top of the percentile histogram (default: max scale / scale factor)')
+    parser.add_argument('--auto-scale', metavar='max|pNN',
+                        help='pre-scan every Spray file and set a static max scale from the global maximum '
+                             'or a percentile of the active cells, e.g. p99')
+    parser.add_argument('--reuse-frames', action='store_true',
+                        help='copy the KML of an identical earlier Spray frame instead of contouring it again')
+    parser.add_argument('--frame-quantum', type=float, metavar='STEP',
+                        help='with --reuse-frames, frames whose values differ by less than STEP count as identical')
+    parser.add_argument('--prefetch', type=int, metavar='N',
+                        help='Spray frames read ahead of contouring (0 reads synchronously)')
+    parser.add_argument('--preview', action='store_true',
+                        help='only write a coarse <name>_preview.kml per file and print its extent and value range')
+    parser.add_argument('--preview-levels', type=int, default=20, help='contour levels of a preview (default: 20)')
+    parser.add_argument('--preview-cells', type=int, default=200,
+                        help='largest number of grid nodes per side in a preview (default: 200)')
+    parser.add_argument('--preview-method', choices=('max', 'stride'), default='max',
+                        help='decimation: block maximum or every n-th node (default: max)')
+    parser.add_argument('--profile', action='store_true', help='print per-stage timing and memory for every file')
+    parser.add_argument('--profile-report', help='write the per-stage profile of the run to this JSON file')
+    parser.add_argument('--file-timeout', type=float, metavar='SECONDS',
+                        help='give up a file after this many seconds and go on with the batch')
+    parser.add_argument('--frame-timeout', type=float, metavar='SECONDS',
+                        help='give up a Spray frame after this many seconds and go on with the file')
+    parser.add_argument('--progress', action='store_true',
+                        help='print file, frame and level progress to stderr about once a second (without -j)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only report failures')
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Command line entry point.
+
+    Returns:
+        int : 0 on success, 1 if any file failed, 2 on usage errors
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    app_config = AppConfig()
+    spray_config = SprayConfig()
+    try:
+        if args.config:
+            load_config(app_config, args.config)
+        if args.spray_config:
+            load_config(spray_config, args.spray_config)
+    except (OSError, ValueError) as e:
+        print(f'Failed to load configuration: {e}', file=sys.stderr)
+        return 2
+
+    if args.output_dir:
+        app_config.base = args.output_dir
+        spray_config.kml_output_dir = args.output_dir
+    if args.levels is not None:
+        app_config.levels = args.levels
+        spray_config.kml_levels = args.levels
+        spray_config.kml_level_values = []
+    if args.zone:
+        app_config.zone = args.zone
+        spray_config.zone = args.zone
+    if args.columns:
+        app_config.value_columns = args.columns
+    if args.column_workers is not None:
+        app_config.column_workers = args.column_workers
+    elif args.workers > 1:
+        # Files are already converted in parallel, keep each file in its worker
+        app_config.column_workers = 1
+    if args.clip:
+        app_config.clip_bounds = args.clip
+    if args.clip_crs:
+        app_config.clip_crs = args.clip_crs
+    if args.file_timeout is not None:
+        app_config.file_timeout = spray_config.file_timeout = args.file_timeout or None
+    if args.frame_timeout is not None:
+        spray_config.frame_timeout = args.frame_timeout or None
+    if args.raster:
+        app_config.output_mode = spray_config.output_mode = 'raster'
+    if args.shared_styles:
+        app_config.shared_styles = spray_config.shared_styles = True
+    if args.float32:
+        app_config.float32 = spray_config.float32 = True
+    if args.stream_row_groups:
+        app_config.stream_row_groups = True
+    if args.species:
+        spray_config.species = args.species
+    if args.vertical_levels:
+        spray_config.vertical_levels = args.vertical_levels
+    if args.specie_names:
+        spray_config.specie_names = args.specie_names
+    if args.reduce:
+        spray_config.reductions = args.reduce
+    for option, name in (('window', 'reduction_window'), ('percentile', 'percentile'),
+                         ('threshold', 'reduction_threshold'), ('histogram_bins', 'histogram_bins'),
+                         ('histogram_max', 'histogram_max')):
+        if getattr(args, option) is not None:
+            setattr(spray_config, name, getattr(args, option))
+    if args.auto_scale:
+        spray_config.auto_scale = args.auto_scale
+    if args.reuse_frames:
+        spray_config.reuse_frames = True
+    if args.frame_quantum is not None:
+        spray_config.frame_quantum = args.frame_quantum
+    if args.prefetch is not None:
+        spray_config.prefetch_frames = args.prefetch
+    if args.auto_crop is not None:
+        app_config.auto_crop = args.auto_crop
+        spray_config.auto_crop = args.auto_crop
+
+    files = expand_inputs(args.inputs, args.recursive)
+    if not files:
+        print('No input files found', file=sys.stderr)
+        return 2
+
+    if args.preview:
+        failures = 0
+        for file_path in files:
+            try:
+                print(preview_file(file_path, app_config, spray_config, args.preview_levels,
+                                   args.preview_cells, args.preview_method), end='', flush=True)
+            except Exception as e:
+                failures += 1
+                print(f'Error in {Path(file_path).name}: {e}', file=sys.stderr, flush=True)
+        return 1 if failures else 0
+
+    spray_files = [path for path in files if Path(path).suffix.lower() in SPRAY_SUFFIXES and os.path.isfile(path)]
+    if spray_config.auto_scale and spray_files:
+        from spray import apply_global_scale
+        try:
+            summary = apply_global_scale(spray_config, spray_files)
+        except Exception as e:
+            print(f'Failed to pre-scan the Spray files: {e}', file=sys.stderr)
+            return 2
+        if not args.quiet:
+            print(summary, end='', flush=True)
+
+    profile = args.profile or bool(args.profile_report) or app_config.profile or spray_config.profile
+    profile_report = args.profile_report or app_config.profile_report or spray_config.profile_report
+    reports = []
+    failures = 0
+    if args.workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=args.workers) as executor:
+            futures = [executor.submit(convert_file, path, app_config, spray_config, profile, None, index, len(files))
+                       for index, path in enumerate(files, 1)]
+            results = (future.result() for future in as_completed(futures))
+            failures = report_results(results, reports, args.quiet)
+    else:
+        # One process: outputs are written on a background thread while the next file is computed
+        from main import async_writer
+        from progress import ProgressReporter, describe, reporting
+
+        on_progress = (lambda state: print(f'  {describe(state)}', file=sys.stderr, flush=True)) if args.progress else None
+        reporter = ProgressReporter(on_progress=on_progress, interval=1.0)
+
+        with async_writer() as writer, reporting(reporter):
+            results = (convert_file(path, app_config, spray_config, profile, writer, index, len(files))
+                       for index, path in enumerate(files, 1))
+            failures = report_results(settle_results(results, writer), reports, args.quiet)
+
+    if profile_report:
+        from main import write_profile_report
+        write_profile_report(profile_report, reports)
+
+    if not args.quiet:
+        print(f'{len(files) - failures}/{len(files)} files converted')
+    return 1 if failures else 0
+
+
+def settle_results(results, writer):
+    """
+    Yields convert_file results once every output of their file is written.
+
+    A file's failed writes are added to its error. The next files are
+    converted while the outputs of the earlier ones are still being
+    written, so a result may come out a file later than it was computed.
+    """
+    waiting = deque()
+    for result in results:
+        waiting.append(result)
+        while waiting and not writer.pending(waiting[0][0]):
+            yield with_write_errors(waiting.popleft(), writer)
+    for result in waiting:
+        writer.wait(result[0])
+        yield with_write_errors(result, writer)
+
+
+def with_write_errors(result, writer):
+    """Adds the failed writes of a convert_file result's file to its error."""
+    file_path, error, file_reports, skipped = result
+    messages = [f'failed to write {Path(path).name}: {e}' for _, path, e in writer.pop_errors(file_path)]
+    if messages:
+        error = '\n'.join(([error] if error is not None else []) + messages)
+    return file_path, error, file_reports, skipped
+
+
+def report_results(results, reports: list[dict], quiet: bool = False) -> int:
+    """
+    Prints one line per converted file and returns the number of failures.
+
+    Frames given up on after a frame timeout are listed but not counted.
+
+    Profiling reports are printed unless quiet and collected into reports.
+    """
+    from main import format_report
+
+    failures = 0
+    for file_path, error, file_reports, skipped in results:
+        if error is None:
+            if not quiet:
+                print(f'Completed {Path(file_path).name}', flush=True)
+        else:
+            failures += 1
+            print(f'Error in {Path(file_path).name}: {error}', file=sys.stderr, flush=True)
+        for _, frame, item, reason in skipped:
+            what = f'frame {frame}' if item is None else f'frame {frame} ({item})'
+            print(f'Skipped {Path(file_path).name} {what}: {reason}', file=sys.stderr, flush=True)
+        for report in file_reports:
+            if not quiet:
+                print(format_report(report), end='', flush=True)
+            reports.append(report)
+    return failures
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,11 +1,16 @@
-import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib.path as mpltPath
-from pyproj import Proj
-import numpy as np
+# pandas, matplotlib, pyproj and numpy are imported inside the functions that
+# use them so that the GUI and the command line start without loading them.
+from contextlib import contextmanager, nullcontext
+import io
+import json
 import os
+import queue
 import sys
+import threading
 import time
+import tracemalloc
+
+import progress
 
 
 COLOR_LIST = ['0000ffff', '0100ffff', '0200ffff', '0300ffff', '0400ffff', '0500ffff', '0600ffff', '0700ffff', '0800ffff', '0900ffff', '0a00ffff', '0b00ffff', '0c00ffff', '0d00ffff', '0e00ffff', '0f00ffff', '1000ffff', '1100ffff', '1200ffff', '1300ffff', '1400ffff', '1500ffff', '1600ffff', '1700ffff', '1800ffff', '1900ffff', '1a00ffff', '1b00ffff', '1c00ffff', '1d00ffff', '1e00ffff', '1f00ffff', '2000ffff', '2100ffff', '2200ffff', '2300ffff', '2400ffff', '2500ffff', '2600ffff', '2700ffff', '2800ffff', '2900ffff', '2a00ffff', '2b00ffff', '2c00ffff', '2d00ffff', '2e00ffff', '2f00ffff', '3000ffff', '3100ffff', '3200ffff', '3300ffff', '3400ffff', '3500ffff', '3600ffff', '3700ffff', '3800ffff', '3900ffff', '3a00ffff', '3b00ffff', '3c00ffff', '3d00ffff', '3e00ffff', '3f00ffff', '4000ffff', '4100ffff', '4200ffff', '4300ffff', '4400ffff', '4500ffff', '4600ffff', '4700ffff', '4800ffff', '4900ffff', '4a00ffff', '4b00ffff', '4c00ffff', '4d00ffff', '4e00ffff', '4e00feff', '4e00fdff', '4e00fcff', '4e00fbff', '4e00faff', '4e00f9ff', '4e00f8ff', '4e00f7ff', '4e00f6ff', '4e00f5ff', '4e00f4ff', '4e00f3ff', '4e00f2ff', '4e00f1ff', '4e00f0ff', '4e00efff', '4e00eeff', '4e00edff', '4e00ecff', '4e00ebff', '4e00eaff', '4e00e9ff', '4e00e8ff', '4e00e7ff', '4e00e6ff', '4e00e5ff', '4e00e4ff', '4e00e3ff', '4e00e2ff', '4e00e1ff', '4e00e0ff', '4e00dfff', '4e00deff', '4e00ddff', '4e00dcff', '4e00dbff', '4e00daff', '4e00d9ff', '4e00d8ff', '4e00d7ff', '4e00d6ff', '4e00d5ff', '4e00d4ff', '4e00d3ff', '4e00d2ff', '4e00d1ff', '4e00d0ff', '4e00cfff', '4e00ceff', '4e00cdff', '4e00cbff', '4e00caff', '4e00c9ff', '4e00c8ff', '4e00c7ff', '4e00c6ff', '4e00c5ff', '4e00c4ff', '4e00c3ff', '4e00c2ff', '4e00c1ff', '4e00c0ff', '4e00bfff', '4e00beff', '4e00bdff', '4e00bcff', '4e00bbff', '4e00baff', '4e00b9ff', '4e00b8ff', '4e00b7ff', '4e00b6ff', '4e00b5ff', '4e00b4ff', '4e00b3ff', '4e00b2ff', '4e00b1ff', '4e00b0ff', '4e00afff', '4e00aeff', '4e00adff', '4e00acff', '4e00abff', '4e00aaff', '4e00a9ff', '4e00a8ff', '4e00a7ff', '4e00a6ff', '4e00a5ff', '4e00a4ff', '4e00a3ff', '4e00a2ff', '4e00a1ff', '4e00a0ff', '4e009fff', '4e009eff', '4e009dff', '4e009cff', '4e009bff', '4e0099ff', '4e0098ff', '4e0097ff', '4e0096ff', '4e0095ff', '4e0094ff', '4e0093ff', '4e0092ff', '4e0091ff', '4e0090ff', '4e008fff', '4e008eff', '4e008dff', '4e008cff', '4e008bff', '4e008aff', '4e0089ff', '4e0088ff', '4e0087ff', '4e0086ff', '4e0085ff', '4e0084ff', '4e0083ff', '4e0082ff', '4e0081ff', '4e0080ff', '4e007fff', '4e007eff', '4e007dff', '4e007cff', '4e007bff', '4e007aff', '4e0079ff', '4e0078ff', '4e0077ff', '4e0076ff', '4e0075ff', '4e0074ff', '4e0073ff', '4e0072ff', '4e0071ff', '4e0070ff', '4e006fff', '4e006eff', '4e006dff', '4e006cff', '4e006bff', '4e006aff', '4e0069ff', '4e0068ff', '4e0066ff', '4e0065ff', '4e0064ff', '4e0063ff', '4e0062ff', '4e0061ff', '4e0060ff', '4e005fff', '4e005eff', '4e005dff', '4e005cff', '4e005bff', '4e005aff', '4e0059ff', '4e0058ff', '4e0057ff', '4e0056ff', '4e0055ff', '4e0054ff', '4e0053ff', '4e0052ff', '4e0051ff', '4e0050ff', '4e004fff', '4e004eff', '4e004dff', '4e004cff', '4e004bff', '4e004aff', '4e0049ff', '4e0048ff', '4e0047ff', '4e0046ff', '4e0045ff', '4e0044ff', '4e0043ff', '4e0042ff', '4e0041ff', '4e0040ff', '4e003fff', '4e003eff', '4e003dff', '4e003cff', '4e003bff', '4e003aff', '4e0039ff', '4e0038ff', '4e0037ff', '4e0036ff', '4e0035ff', '4e0033ff', '4e0032ff', '4e0031ff', '4e0030ff', '4e002fff', '4e002eff', '4e002dff', '4e002cff', '4e002bff', '4e002aff', '4e0029ff', '4e0028ff', '4e0027ff', '4e0026ff', '4e0025ff', '4e0024ff', '4e0023ff', '4e0022ff', '4e0021ff', '4e0020ff', '4e001fff', '4e001eff', '4e001dff', '4e001cff', '4e001bff', '4e001aff', '4e0019ff', '4e0018ff', '4e0017ff', '4e0016ff', '4e0015ff', '4e0014ff', '4e0013ff', '4e0012ff', '4e0011ff', '4e0010ff', '4e000fff', '4e000eff', '4e000dff', '4e000cff', '4e000bff', '4e000aff', '4e0009ff', '4e0008ff', '4e0007ff', '4e0006ff', '4e0005ff', '4e0004ff', '4e0003ff', '4e0002ff', '4e0000ff', '4e0000fe', '4e0100fc', '4e0200fa', '4e0200f9', '4e0300f7', '4e0400f5', '4e0400f4', '4e0500f2', '4e0600f0', '4e0600ee', '4e0700ed', '4e0800eb', '4e0800e9', '4e0900e8', '4e0a00e6', '4e0a00e4', '4e0b00e3', '4e0c00e1', '4e0c00df', '4e0d00dd', '4e0e00dc', '4e0e00da', '4e0f00d8', '4e1000d7', '4e1100d5', '4e1100d3', '4e1200d2', '4e1300d0', '4e1300ce', '4e1400cc', '4e1500cb', '4e1500c9', '4e1600c7', '4e1700c6', '4e1700c4', '4e1800c2', '4e1900c1', '4e1900bf', '4e1a00bd', '4e1b00bb', '4e1b00ba', '4e1c00b8', '4e1d00b6', '4e1d00b5', '4e1e00b3', '4e1f00b1', '4e1f00b0', '4e2000ae', '4e2100ac', '4e2200aa', '4e2200a9', '4e2300a7', '4e2400a5', '4e2400a4', '4e2500a2', '4e2600a0', '4e26009f', '4e27009d', '4e28009b', '4e28009a', '4e290098', '4e2a0096', '4e2a0094', '4e2b0093', '4e2c0091', '4e2c008f', '4e2d008e', '4e2e008c', '4e2e008a', '4e2f0089', '4e300087', '4e300085', '4e310083', '4e320082', '4e330080', '4e33007e', '4e34007d', '4e35007b', '4e350079', '4e360077', '4e370076', '4e370074', '4e380072', '4e390071', '4e39006f', '4e3a006d', '4e3b006c', '4e3b006a', '4e3c0068', '4e3d0066', '4e3d0065', '4e3e0063', '4e3f0061', '4e3f0060', '4e40005e', '4e41005c', '4e41005b', '4e420059', '4e430057', '4e440055']
@@ -29,108 +34,695 @@ X_SHIFT = 0
 X_SCALE_FACTOR = 1
 Y_SCALE_FACTOR = 1
 
+# Binary grid inputs read by load_grid_file, columnar tables read by
+# load_columnar_file; everything else is read as CSV
+GRID_SUFFIXES = ('.npy', '.npz', '.bin', '.raw')
+COLUMNAR_SUFFIXES = ('.parquet', '.feather')
+
+# Rows parsed at a time by load_csv_file_conf, between two cancellation points
+CSV_CHUNK_ROWS = 500_000
+
+# Per-stage instrumentation, switched on at runtime with enable_profiling()
+PROFILE = False
+PROFILE_MEMORY = True
+_profile_reports = []
+_NO_STAGE = nullcontext()
+
+# KML documents of the last rendered grids by frame_fingerprint, oldest
+# first, rendered with _NAME_MARK in place of NAME (see write_grid_kml);
+# cleared with clear_rendered() at the end of every Spray file
+_rendered = {}
+RENDERED_LIMIT = 8
+_NAME_MARK = '\x00name\x00'
+
 def resourcePath(relativePath):
     """ Get absolute path to resource, works for dev and for PyInstaller """
     try:
         # PyInstaller creates a temp folder and stores path in _MEIPASS
         basePath = sys._MEIPASS
     except Exception:
-        basePath = os.path.abspath(".")
+        basePath = os.path.dirname(os.path.abspath(__file__))
 
     return os.path.join(basePath, relativePath)
 
-class poligoni:
-    def __init__(self, level):
-        self.level = level
-        self.poligono = []
+def enable_profiling(enabled=True, memory=True):
+    """
+    Switches per-stage timing and memory tracing on or off.
+
+    While off, stage() returns a shared no-op context manager and nothing
+    is traced or recorded.
+
+    Args:
+        enabled : record a report for every converted file
+        memory : also trace peak memory with tracemalloc, which slows
+                 pure-Python stages such as writing noticeably
+    """
+    global PROFILE
+    global PROFILE_MEMORY
+    PROFILE = enabled
+    PROFILE_MEMORY = memory
+    if not (enabled and memory) and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+def begin_report(source):
+    """Starts the profiling report of one input file."""
+    if PROFILE:
+        _profile_reports.append({'file': str(source), 'stages': []})
+
+def note(**values):
+    """Adds counters (grid size, rings, bytes, ...) to the current report."""
+    if PROFILE and _profile_reports:
+        _profile_reports[-1].update(values)
+
+def stage(name):
+    """
+    Context manager recording wall time and peak traced memory of a stage.
+
+    The peak counts only what the stage allocates on top of the memory
+    already traced when it starts.
+
+    Args:
+        name : stage name shown in the report
+    """
+    if not PROFILE or not _profile_reports:
+        return _NO_STAGE
+    return _profiled_stage(name)
+
+@contextmanager
+def _profiled_stage(name):
+    if PROFILE_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        # Memory already held when the stage starts is not the stage's own
+        baseline = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record = {'stage': name, 'seconds': time.perf_counter() - start}
+        if PROFILE_MEMORY:
+            record['peak_bytes'] = max(tracemalloc.get_traced_memory()[1] - baseline, 0)
+        _profile_reports[-1]['stages'].append(record)
+
+def pop_profile_reports():
+    """Returns the reports recorded so far and clears them."""
+    reports = _profile_reports[:]
+    _profile_reports.clear()
+    return reports
+
+def format_report(report):
+    """
+    Formats one report as a short multi-line summary for the output log.
+    """
+    lines = [f'  Profile {os.path.basename(report["file"])}:']
+    for rec in report['stages']:
+        line = f'    {rec["stage"]:<11}{rec["seconds"]:9.3f} s'
+        if 'peak_bytes' in rec:
+            line += f'  peak {rec["peak_bytes"] / 2**20:8.1f} MB'
+        lines.append(line)
+    counters = []
+    if 'grid' in report:
+        counters.append(f'grid {report["grid"][0]}x{report["grid"][1]}')
+    if 'rings' in report:
+        counters.append(f'{report["rings"]} rings, {report["vertices"]} vertices')
+    if 'output_bytes' in report:
+        counters.append(f'{report["output_bytes"] / 2**20:.2f} MB written')
+    if 'reused' in report:
+        counters.append(f'same as {report["reused"]}')
+    if counters:
+        lines.append('    ' + ', '.join(counters))
+    return '\n'.join(lines) + '\n'
+
+def write_profile_report(path, reports):
+    """Writes a list of reports to a JSON file."""
+    with open(path, 'w') as f:
+        json.dump({'created': time.strftime('%Y-%m-%dT%H:%M:%S'), 'files': reports}, f, indent=2)
+
+class OutputWriter:
+    """
+    Writes finished output files on a dedicated I/O thread.
+
+    Buffers are queued with submit() and written in order; the queue is
+    bounded so at most depth buffers wait in memory. A failed write is kept
+    with the input file set in source when it was submitted; pending() and
+    wait() tell when every output of an input file is written.
+
+    Attributes:
+        source : the input file whose outputs are being submitted
+    """
+
+    def __init__(self, depth=4):
+        self.source = None
+        self._queue = queue.Queue(maxsize=depth)
+        self._errors = []
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._written = threading.Condition(self._lock)
+        self._thread = threading.Thread(target=self._run, name='kml-writer', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            source, path, text = item
+            error = None
+            try:
+                with open(path, 'wb' if isinstance(text, bytes) else 'w') as f:
+                    f.write(text)
+            except Exception as e:
+                error = e
+            with self._written:
+                if error is not None:
+                    self._errors.append((source, path, error))
+                self._pending[source] -= 1
+                if not self._pending[source]:
+                    del self._pending[source]
+                self._written.notify_all()
+
+    def submit(self, path, text):
+        """Queues text to be written to path, waiting while the queue is full."""
+        with self._lock:
+            self._pending[self.source] = self._pending.get(self.source, 0) + 1
+        self._queue.put((self.source, path, text))
+
+    def pending(self, source):
+        """Returns the number of outputs of source queued and not written yet."""
+        with self._lock:
+            return self._pending.get(source, 0)
+
+    def wait(self, source):
+        """Blocks until every output of source queued so far is written."""
+        with self._written:
+            self._written.wait_for(lambda: source not in self._pending)
+
+    def pop_errors(self, source=None):
+        """
+        Returns the (source, path, exception) of the failed writes so far and clears them.
+
+        Args:
+            source : only return and clear the failed writes of this input file
+        """
+        with self._lock:
+            errors = [error for error in self._errors if source is None or error[0] == source]
+            self._errors = [error for error in self._errors if error not in errors]
+        return errors
+
+    def close(self):
+        """Writes the remaining buffers and stops the thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+_writer = None
+
+@contextmanager
+def async_writer(depth=4):
+    """
+    Routes the KML and scale writes of the enclosed conversions to an OutputWriter.
+
+    Every queued file is on disk when the block exits; failed writes are
+    returned by pop_errors() on the yielded writer, also after the block.
 
-def inside(poly, point):
+    Args:
+        depth : number of output buffers allowed to wait for the disk
+    """
+    global _writer
+    writer = OutputWriter(depth)
+    _writer = writer
+    try:
+        yield writer
+    finally:
+        _writer = None
+        writer.close()
+
+def write_output(path, text):
+    """Writes a text or bytes output file, through the active async_writer if there is one."""
+    if _writer is not None:
+        _writer.submit(path, text)
+    else:
+        with open(path, 'wb' if isinstance(text, bytes) else 'w') as f:
+            f.write(text)
+
+class ContourGeometry:
     """
-    Checks if a point is inside a polygon.
+    Contour rings of every level stored in flat arrays.
+
+    Ring r is vertices[ring_offsets[r]:ring_offsets[r + 1]] and level i owns
+    rings level_offsets[i] to level_offsets[i + 1] - 1.
+
+    Attributes:
+        vertices : (n, 2) float64 buffer of output coordinates
+        ring_offsets : start of every ring in vertices, followed by n
+        level_offsets : first ring of every level, followed by the ring count
+        levels : contour value of every level
+    """
+    __slots__ = ('vertices', 'ring_offsets', 'level_offsets', 'levels')
+
+    def __init__(self, vertices, ring_offsets, level_offsets, levels):
+        self.vertices = vertices
+        self.ring_offsets = ring_offsets
+        self.level_offsets = level_offsets
+        self.levels = levels
+
+    def __len__(self):
+        return len(self.levels)
+
+    @property
+    def ring_count(self):
+        return len(self.ring_offsets) - 1
+
+    @property
+    def vertex_count(self):
+        return len(self.vertices)
+
+    def level_rings(self, i):
+        """Range of the ring indices of level i."""
+        return range(self.level_offsets[i], self.level_offsets[i + 1])
+
+    def ring(self, r):
+        """(n, 2) view of the vertices of ring r."""
+        return self.vertices[self.ring_offsets[r]:self.ring_offsets[r + 1]]
+
+def nest_rings(geometry):
+    """
+    Finds, for every ring, the ring of the previous level that contains it.
+
+    A ring's parent is the first ring of the previous level containing its
+    first vertex. Parents are only searched where the previous level has
+    more than one ring, as the writer uses a single previous ring as is.
 
     Args:
-        poly : list of (x,y) pairs defining the polygon
-        point : (x,y) pair defining the point
+        geometry : ContourGeometry
 
     Returns:
-        bool : True if point is inside polygon, False otherwise
+        array : parent ring index for every ring, -1 when there is none
     """
-    path = mpltPath.Path(poly)
-    return path.contains_point(point)
+    import numpy as np
+    from matplotlib.path import Path
+
+    parents = np.full(geometry.ring_count, -1, dtype=np.intp)
+    for i in range(1, len(geometry)):
+        # Levels with thousands of rings are slow to nest: a cancellation point per level
+        progress.check()
+        pre = geometry.level_rings(i - 1)
+        cur = geometry.level_rings(i)
+        if len(pre) < 2 or len(cur) == 0:
+            continue
+        firsts = geometry.vertices[geometry.ring_offsets[cur.start:cur.stop]]
+        pending = np.arange(len(cur))
+        for p in pre:
+            hits = Path(geometry.ring(p)).contains_points(firsts[pending])
+            parents[cur.start + pending[hits]] = p
+            pending = pending[~hits]
+            if len(pending) == 0:
+                break
+    return parents
+
+def compute_dtype(Z):
+    """Float type grid values are computed in: float32 grids stay float32, anything else is float64."""
+    import numpy as np
 
-def load_csv_file_conf(csv_file):
+    return np.float32 if np.asarray(Z).dtype == np.float32 else np.float64
+
+def load_csv_file_conf(csv_file, dtype=float, value_columns=None):
     """
     Reads a CSV file and returns a dataframe.
+
+    Lines before the header (the first line naming X_COL) are skipped and
+    the X_COL, Y_COL and VAL_COL columns are renamed x_km, y_km and value.
+    The coordinate columns are always float64, the value column is dtype.
+
+    With value_columns only x_km, y_km and those columns are read, under
+    the given names (matched ignoring case) and scaled like value.
     """
+    import pandas as pd
+
     with open(csv_file, 'r') as csv_f:
-        content = csv_f.readlines()
-        dataframe = []
-    for i,line in enumerate(content):
-        if X_COL in line or X_COL.upper() in line or X_COL.capitalize() in line:
-            start = i
-            break
-    for line in content[start:]:
-        line = line.strip()
-        if line:
-            # Normalize column names to standard format (case-insensitive)
-            line = (line.replace(X_COL, 'x_km').replace(X_COL.lower(), 'x_km')
-                       .replace(X_COL.upper(), 'x_km').replace(X_COL.capitalize(), 'x_km'))
-            line = (line.replace(Y_COL, 'y_km').replace(Y_COL.lower(), 'y_km')
-                       .replace(Y_COL.upper(), 'y_km').replace(Y_COL.capitalize(), 'y_km'))
-            line = (line.replace(VAL_COL, 'value').replace(VAL_COL.lower(), 'value')
-                       .replace(VAL_COL.upper(), 'value').replace(VAL_COL.capitalize(), 'value'))
-            dataframe.append(line.split(',')[:])
-    dataframe = pd.DataFrame(dataframe[1:], columns=dataframe[0])
+        for start, line in enumerate(csv_f):
+            if X_COL in line or X_COL.upper() in line or X_COL.capitalize() in line:
+                break
+        else:
+            raise ValueError(f'No header line with the {X_COL} column')
+    line = line.strip()
+    raw_names = line.split(',')
+    # Normalize column names to standard format (case-insensitive)
+    line = (line.replace(X_COL, 'x_km').replace(X_COL.lower(), 'x_km')
+               .replace(X_COL.upper(), 'x_km').replace(X_COL.capitalize(), 'x_km'))
+    line = (line.replace(Y_COL, 'y_km').replace(Y_COL.lower(), 'y_km')
+               .replace(Y_COL.upper(), 'y_km').replace(Y_COL.capitalize(), 'y_km'))
+    line = (line.replace(VAL_COL, 'value').replace(VAL_COL.lower(), 'value')
+               .replace(VAL_COL.upper(), 'value').replace(VAL_COL.capitalize(), 'value'))
+    names = line.split(',')
+    if value_columns is not None:
+        lookup = {name.strip().lower(): i for i, name in enumerate(raw_names)}
+        missing = [column for column in value_columns if column.lower() not in lookup]
+        if missing:
+            raise ValueError(f'No {", ".join(missing)} column in {os.path.basename(csv_file)}')
+        for column in value_columns:
+            names[lookup[column.lower()]] = column
+        usecols = ['x_km', 'y_km', *value_columns]
+    else:
+        usecols = None
+        value_columns = ['value']
+    # round_trip parsing gives the same doubles as float() on every field;
+    # rows are parsed in chunks with a cancellation point between them
+    chunks = []
+    for chunk in pd.read_csv(csv_file, skiprows=start + 1, header=None, names=names, usecols=usecols,
+                             float_precision='round_trip', chunksize=CSV_CHUNK_ROWS):
+        chunks.append(chunk)
+        progress.check()
+    dataframe = pd.concat(chunks) if len(chunks) != 1 else chunks[0]
     for column in dataframe.columns:
-        dataframe[column] = dataframe[column].astype(float)
+        dataframe[column] = dataframe[column].astype(dtype if column in value_columns else float)
     if SCALE != 1:
-        dataframe['value'] = dataframe['value'] * SCALE
+        for column in value_columns:
+            dataframe[column] = dataframe[column] * SCALE
     return dataframe
 
-def dataframe_contures(dataframe):
+def load_columnar_file(table_file, dtype=float, stream=False, value_columns=None):
     """
-    Creates a graph from a dataframe.
+    Reads a Parquet or Feather table and returns a dataframe like load_csv_file_conf.
+
+    Only the X_COL, Y_COL and VAL_COL columns are read (matched like the
+    CSV header, ignoring case) and renamed x_km, y_km and value; with
+    value_columns, those columns are read instead of VAL_COL, under the
+    given names. Feather files are memory-mapped.
+
+    Args:
+        table_file : the .parquet or .feather file to read
+        dtype : type of the value column; the coordinates are float64
+        stream : read one Parquet row group or Feather record batch at a
+                 time into the output columns instead of the whole table,
+                 bounding the memory of Arrow buffers to one group
+        value_columns : value columns to read instead of VAL_COL
+
+    Returns:
+        DataFrame : x_km, y_km and value (or value_columns) columns, values scaled by SCALE
     """
-    X = dataframe['x_km'][:]
-    unique_x = sorted(list(set(X)))
-    Y = dataframe['y_km'][:]
-    unique_y = sorted(list(set(Y)))
-    Z = np.array(dataframe['value'][:])
-    if X[0] == X[1]:
-        Z = Z.reshape(len(unique_x), len(unique_y))
-        Z = Z.T
+    import numpy as np
+    import pandas as pd
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError('Reading Parquet and Feather files requires pyarrow') from None
+
+    is_parquet = os.path.splitext(table_file)[1].lower() == '.parquet'
+    if is_parquet:
+        source = pyarrow.parquet.ParquetFile(table_file)
+        names = source.schema_arrow.names
+        rows = source.metadata.num_rows
+        count = source.num_row_groups
+    else:
+        source = pyarrow.ipc.open_file(pyarrow.memory_map(table_file, 'r'))
+        names = source.schema.names
+        count = source.num_record_batches
+        rows = sum(source.get_batch(i).num_rows for i in range(count)) if stream else None
+
+    keys = ['x_km', 'y_km', *(value_columns or ['value'])]
+    columns = []
+    for wanted in (X_COL, Y_COL, *(value_columns or [VAL_COL])):
+        match = [name for name in names if name == wanted] or [name for name in names if name.lower() == wanted.lower()]
+        if not match:
+            raise ValueError(f'No {wanted} column in {os.path.basename(table_file)}')
+        columns.append(match[0])
+    types = [float, float] + [dtype] * (len(keys) - 2)
+
+    if not stream:
+        table = source.read(columns=columns) if is_parquet else source.read_all().select(columns)
+        data = {key: table.column(name).to_numpy().astype(kind, copy=False)
+                for key, name, kind in zip(keys, columns, types)}
     else:
-        Z = Z.reshape(len(unique_y), len(unique_x))
+        data = {key: np.empty(rows, dtype=kind) for key, kind in zip(keys, types)}
+        start = 0
+        for i in range(count):
+            if is_parquet:
+                group = source.read_row_group(i, columns=columns)
+            else:
+                group = pyarrow.Table.from_batches([source.get_batch(i)]).select(columns)
+            stop = start + group.num_rows
+            for key, name in zip(keys, columns):
+                data[key][start:stop] = group.column(name).to_numpy()
+            start = stop
+            del group
+    dataframe = pd.DataFrame(data, copy=False)
+    if SCALE != 1:
+        for key in keys[2:]:
+            dataframe[key] = dataframe[key] * SCALE
+    return dataframe
+
+def dataframe_to_grid(dataframe):
+    """
+    Reshapes the x_km/y_km/value columns of a dataframe into a grid.
+
+    Returns:
+        tuple : (sorted x axis, sorted y axis, values indexed [y, x] as
+                 float32 for a float32 value column, float64 otherwise)
+    """
+    unique_x, unique_y, grids = dataframe_to_grids(dataframe, ['value'])
+    return unique_x, unique_y, grids['value']
+
+def dataframe_to_grids(dataframe, columns):
+    """
+    Reshapes several value columns of a dataframe onto its x_km/y_km grid.
+
+    The axes and the row order are worked out once for all the columns.
+
+    Returns:
+        tuple : (sorted x axis, sorted y axis, {column: values indexed [y, x]})
+    """
+    import numpy as np
+
+    X = dataframe['x_km'].values
+    unique_x = np.unique(X)
+    unique_y = np.unique(dataframe['y_km'].values)
+    x_major = X[0] == X[1]
+    grids = {}
+    for column in columns:
+        Z = np.array(dataframe[column].values, dtype=compute_dtype(dataframe[column].values))
+        if x_major:
+            Z = Z.reshape(len(unique_x), len(unique_y))
+            Z = Z.T
+        else:
+            Z = Z.reshape(len(unique_y), len(unique_x))
+        grids[column] = Z
+    return unique_x, unique_y, grids
+
+def dataframe_contures(dataframe):
+    """
+    Contours a dataframe and projects the rings to output coordinates.
+
+    Returns:
+        tuple : (ContourGeometry, sorted x axis, sorted y axis)
+    """
+    list_x, list_y, Z = dataframe_to_grid(dataframe)
+    return grid_contures(list_x, list_y, Z), list_x, list_y
+
+def sidecar_axis(spec):
+    """Builds a grid axis from a sidecar entry: a list of values or {"start", "step", "count"}."""
+    import numpy as np
+
+    if isinstance(spec, dict):
+        return spec['start'] + spec['step'] * np.arange(spec['count'], dtype=float)
+    return np.asarray(spec, dtype=float)
+
+def load_grid_file(grid_file):
+    """
+    Reads a binary grid without parsing it.
+
+    .npy and raw (.bin/.raw) values are memory-mapped read-only, so only
+    the pages that are used are read and they are shared between processes
+    converting the same file. An .npz holds 'x', 'y' and 'value' arrays
+    and is read into memory (NumPy cannot map compressed archives).
+
+    The JSON sidecar next to the file (grid.npy -> grid.json) gives the
+    axes as 'x' and 'y' (lists, or {"start", "step", "count"}), and for raw
+    files the 'dtype' and optional 'offset' and 'order'. It is optional
+    for .npz. Optional 'zone' is returned for the caller to use as ZONE
+    and 'units' ("km" or "m") converts metre UTM axes to the km the
+    projection expects.
+
+    Returns:
+        tuple : (x axis, y axis, values indexed [y, x], sidecar zone or None)
+                in file order, unscaled
+    """
+    import numpy as np
+
+    suffix = os.path.splitext(grid_file)[1].lower()
+    list_x = list_y = None
+    sidecar_file = os.path.splitext(grid_file)[0] + '.json'
+    meta = {}
+    if os.path.isfile(sidecar_file):
+        with open(sidecar_file, 'r') as f:
+            meta = json.load(f)
+    elif suffix != '.npz':
+        raise ValueError(f'Missing grid sidecar {os.path.basename(sidecar_file)}')
+
+    if suffix == '.npz':
+        with np.load(grid_file) as data:
+            list_x = np.asarray(data['x'], dtype=float) if 'x' in data else None
+            list_y = np.asarray(data['y'], dtype=float) if 'y' in data else None
+            Z = data['value']
+    if 'x' in meta:
+        list_x = sidecar_axis(meta['x'])
+    if 'y' in meta:
+        list_y = sidecar_axis(meta['y'])
+    if suffix != '.npz' and ('x' not in meta or 'y' not in meta):
+        raise ValueError(f'{os.path.basename(sidecar_file)} must give the x and y axes')
+    if list_x is None or list_y is None:
+        raise ValueError(f'{os.path.basename(grid_file)} has no x and y axes')
+
+    shape = (len(list_y), len(list_x))
+    if suffix == '.npy':
+        Z = np.load(grid_file, mmap_mode='r')
+    elif suffix != '.npz':
+        if 'dtype' not in meta:
+            raise ValueError(f'{os.path.basename(sidecar_file)} must give the dtype of the raw values')
+        Z = np.memmap(grid_file, dtype=meta['dtype'], mode='r', offset=meta.get('offset', 0),
+                      shape=shape, order=meta.get('order', 'C'))
+    if Z.shape != shape:
+        raise ValueError(f'Grid shape {Z.shape} does not match the {len(list_y)} y by {len(list_x)} x axes')
+
+    zone = str(meta['zone']) if 'zone' in meta else None
+    if meta.get('units', 'km') == 'm' and PROJIN.lower() == 'utm':
+        list_x, list_y = list_x / 1000, list_y / 1000
+    return list_x, list_y, Z, zone
+
+def load_input_grid(input_file, dtype=float, stream=False):
+    """
+    Reads a CSV, columnar or binary grid input into sorted axes and scaled values.
+
+    Args:
+        input_file : a CSV file, a Parquet/Feather table (see COLUMNAR_SUFFIXES)
+                     or a binary grid (see GRID_SUFFIXES)
+        dtype : value type of CSV and columnar grids; np.float32 also
+                converts binary grids of other types, which otherwise keep their own
+        stream : read columnar tables one row group at a time, see load_columnar_file
+
+    Returns:
+        tuple : (sorted x axis, sorted y axis, values indexed [y, x], zone of a
+                 binary grid's sidecar or None); the caller applies the zone
+    """
+    import numpy as np
+
+    suffix = os.path.splitext(input_file)[1].lower()
+    if suffix not in GRID_SUFFIXES:
+        if suffix in COLUMNAR_SUFFIXES:
+            dataframe = load_columnar_file(input_file, dtype, stream)
+        else:
+            dataframe = load_csv_file_conf(input_file, dtype)
+        list_x, list_y, Z = dataframe_to_grid(dataframe)
+        del dataframe
+        return list_x, list_y, Z, None
+    list_x, list_y, Z, zone = load_grid_file(input_file)
+    if dtype is np.float32 and Z.dtype != np.float32:
+        Z = Z.astype(np.float32)
+    return (*prepare_grid(list_x, list_y, Z), zone)
+
+def axis_window(axis, low, high):
+    """
+    Finds the slice of a sorted axis whose values lie within [low, high].
+
+    Args:
+        axis : ascending or descending 1D array
+        low, high : inclusive bounds
+
+    Returns:
+        slice : index window, possibly empty
+    """
+    import numpy as np
+
+    if axis[0] <= axis[-1]:
+        return slice(np.searchsorted(axis, low, 'left'), np.searchsorted(axis, high, 'right'))
+    reverse = axis[::-1]
+    return slice(len(axis) - np.searchsorted(reverse, high, 'right'),
+                 len(axis) - np.searchsorted(reverse, low, 'left'))
+
+def clip_grid(list_x, list_y, Z, bounds, crs='input'):
+    """
+    Clips a grid to a bounding box without copying the values.
+
+    Args:
+        list_x, list_y : sorted grid axes in input coordinates
+        Z : values indexed [y, x]
+        bounds : (x_min, x_max, y_min, y_max), or (lon_min, lon_max,
+                 lat_min, lat_max) when crs is 'wgs84'
+        crs : 'input' for bounds in the grid coordinates, 'wgs84' for
+              geographic bounds
+
+    Returns:
+        tuple : (clipped x axis, clipped y axis, view of Z)
+    """
+    x_min, x_max, y_min, y_max = bounds
+    if crs.lower() == 'wgs84':
+        x_min, x_max, y_min, y_max = bounds_to_input(bounds)
+    x_slice = axis_window(list_x, x_min, x_max)
+    y_slice = axis_window(list_y, y_min, y_max)
+    if x_slice.start >= x_slice.stop or y_slice.start >= y_slice.stop:
+        raise ValueError('No grid points found within the clipping bounds')
+    return list_x[x_slice], list_y[y_slice], Z[y_slice, x_slice]
+
+def grid_contures(list_x, list_y, Z):
+    """
+    Contours a grid and projects the rings to output coordinates.
+
+    Args:
+        list_x, list_y : sorted grid axes in input coordinates
+        Z : values indexed [y, x]; it is copied, not modified, keeping
+            float32 values in float32 (see compute_dtype)
+
+    Returns:
+        ContourGeometry : the projected contour rings
+    """
+    import numpy as np
+    from matplotlib.figure import Figure
+
+    Z = np.array(Z, dtype=compute_dtype(Z))
     Z[0,:] = 0
     Z[:,0] = 0
     Z[-1,:] = 0
     Z[:,-1] = 0
-    list_x =  sorted(X.unique())
-    list_y =  sorted(Y.unique())
-    cs = plt.contour(unique_x, unique_y, Z, LEVELS)
-    all_data = []
-    
-    # Use allsegs which works across matplotlib versions
-    for i, level in enumerate(cs.levels):
-        pol = poligoni(level)
-        for seg in cs.allsegs[i]:
-            if len(seg) > 0:
-                # Vectorized conversion - much faster
-                x = seg[:,0]
-                y = seg[:,1]
-                dec_coords = converter_UTM_DEC(x, y)
-                poligon = list(zip(dec_coords[0], dec_coords[1]))
-                pol.poligono.append(poligon)
-        all_data.append(pol)
+    unique_x, unique_y = list_x, list_y
+    note(grid=[len(unique_x), len(unique_y)])
+    levels = LEVELS
+    if np.ndim(LEVELS):
+        # Explicit levels above the grid maximum have no rings and are not written
+        levels = np.asarray(LEVELS, dtype=float)
+        levels = levels[:max(1, int(np.searchsorted(levels, np.nanmax(Z), side='right')))]
+    with stage('contour'):
+        # A bare Figure avoids pyplot's global state and GUI backend
+        cs = Figure().add_subplot().contour(unique_x, unique_y, Z, levels)
+        allsegs = cs.allsegs
     
-    plt.close()
-    return all_data, list_x, list_y
+    # Use allsegs which works across matplotlib versions. Every vertex of
+    # every level is projected in a single call.
+    with stage('projection'):
+        segments = [[seg for seg in level_segs if len(seg) > 0] for level_segs in allsegs]
+        flat = [seg for level_segs in segments for seg in level_segs]
+        ring_offsets = np.zeros(len(flat) + 1, dtype=np.intp)
+        np.cumsum([len(seg) for seg in flat], out=ring_offsets[1:])
+        level_offsets = np.zeros(len(segments) + 1, dtype=np.intp)
+        np.cumsum([len(level_segs) for level_segs in segments], out=level_offsets[1:])
+        if flat:
+            vertices = np.concatenate(flat)
+            dec_x, dec_y = converter_UTM_DEC(vertices[:, 0], vertices[:, 1])
+            vertices = np.column_stack((dec_x, dec_y))
+        else:
+            vertices = np.empty((0, 2))
+        geometry = ContourGeometry(vertices, ring_offsets, level_offsets, np.asarray(cs.levels, dtype=float))
+    note(rings=geometry.ring_count, vertices=geometry.vertex_count)
+    return geometry
 
 # Cache Proj object for better performance
 _proj_cache = {}
 
 def get_proj():
     """Get cached Proj object."""
+    from pyproj import Proj
+
     key = (PROJIN, ZONE, PROJOUT)
     if key not in _proj_cache:
         _proj_cache[key] = Proj(proj=PROJIN, zone=ZONE, ellps=PROJOUT)
@@ -141,6 +733,8 @@ def converter_UTM_DEC(utm_x, utm_y):
     Converts UTM coordinates to DEC coordinates.
     Supports both single values and arrays.
     """
+    import numpy as np
+
     p = get_proj()
     
     # Handle arrays or single values
@@ -159,36 +753,66 @@ def converter_UTM_DEC(utm_x, utm_y):
     
     return dec_x, dec_y
 
-def dataframe_manipulation(dataframe):
+def converter_DEC_UTM(dec_x, dec_y):
     """
-    Takes a dataframe and returns a dataframe with the data manipoled.
+    Converts DEC coordinates to input coordinates, the inverse of converter_UTM_DEC.
+    """
+    import numpy as np
+
+    utm_x, utm_y = get_proj()(np.asarray(dec_x, dtype=float), np.asarray(dec_y, dtype=float))
+    if PROJIN.lower() == 'utm':
+        return utm_x / 1000, utm_y / 1000
+    return utm_x, utm_y
+
+def bounds_to_input(bounds, samples=32):
+    """
+    Converts a (lon_min, lon_max, lat_min, lat_max) box to input coordinates.
+
+    The box edges are densified before projecting, so the returned
+    (x_min, x_max, y_min, y_max) covers the whole geographic box.
+    """
+    import numpy as np
+
+    lon_min, lon_max, lat_min, lat_max = bounds
+    lons = np.linspace(lon_min, lon_max, samples)
+    lats = np.linspace(lat_min, lat_max, samples)
+    edge_lon = np.concatenate([lons, lons, np.full(samples, lon_min), np.full(samples, lon_max)])
+    edge_lat = np.concatenate([np.full(samples, lat_min), np.full(samples, lat_max), lats, lats])
+    x, y = converter_DEC_UTM(edge_lon, edge_lat)
+    return x.min(), x.max(), y.min(), y.max()
+
+def grid_extent(list_x, list_y):
+    """
+    Computes the bounding box of a grid in output coordinates.
+
+    Only the boundary nodes of the grid are projected. The projection is
+    smooth and one-to-one, so the extremes of the projected grid lie on
+    its edges and the result matches projecting every point.
 
     Args:
-        dataframe : dataframe containing the data
+        list_x : sorted x axis of the grid
+        list_y : sorted y axis of the grid
 
     Returns:
-        dataframe : dataframe 
+        list : [min_x, max_x, min_y, max_y] in output coordinates
     """
-    # Sort by value 
-    dataframe['value'] = dataframe['value'].astype(float)
-    dataframe = dataframe.sort_values(by=['value'], ascending=True)
-    dataframe.reset_index(drop=True, inplace=True)
-    
-    # Vectorized conversion - much faster than list comprehension
-    dec_coords = converter_UTM_DEC(dataframe['x_km'].values, dataframe['y_km'].values)
-    dataframe['dec_x'] = dec_coords[0]
-    dataframe['dec_y'] = dec_coords[1]
-    
-    dataframe.drop(['x_km', 'y_km'], axis=1, inplace=True)
-    return dataframe
+    import numpy as np
+
+    xs = np.asarray(list_x, dtype=float)
+    ys = np.asarray(list_y, dtype=float)
+    edge_x = np.concatenate([xs, xs, np.full(len(ys), xs[0]), np.full(len(ys), xs[-1])])
+    edge_y = np.concatenate([np.full(len(xs), ys[0]), np.full(len(xs), ys[-1]), ys, ys])
+    dec_x, dec_y = converter_UTM_DEC(edge_x, edge_y)
+    return [dec_x.min(), dec_x.max(), dec_y.min(), dec_y.max()]
 
-def write_first_chunk(kml_f, lim):
+def write_first_chunk(kml_f, lim, style_bins=()):
     """
     Writes the first chunk of the KML file.
 
     Args:
         kml_f : file to write the KML to
         lim : limit of the dataframe
+        style_bins : COLOR_LIST bins to write as shared styles, see level_bins
     """
     kml_f.write('<?xml version="1.0" encoding="UTF-8"?>\n')
     kml_f.write('<kml xmlns="http://www.opengis.net/kml/2.2">\n')
@@ -226,6 +850,8 @@ def write_first_chunk(kml_f, lim):
     kml_f.write('		<styleUrl>#failed</styleUrl>\n')
     kml_f.write('	</Pair>\n')
     kml_f.write('</StyleMap>\n')
+    for ind in style_bins:
+        kml_f.write(style_text(COLOR_LIST[ind], f'bin{ind}'))
     kml_f.write(f'<Folder><name>{NAME}</name>\n')
     kml_f.write('<Placemark>\n')
     kml_f.write("<name>Receptor's Grid</name>\n")
@@ -236,6 +862,28 @@ def write_first_chunk(kml_f, lim):
     kml_f.write(f'<MultiGeometry><Polygon><outerBoundaryIs><LinearRing><coordinates>{lim[0]},{lim[2]} {lim[1]},{lim[2]} {lim[1]},{lim[3]} {lim[0]},{lim[3]} {lim[0]},{lim[2]} </coordinates></LinearRing></outerBoundaryIs></Polygon></MultiGeometry>\n')
     kml_f.write('</Placemark>\n')
 
+def warm_imports():
+    """
+    Imports the scientific stack ahead of first use.
+
+    Meant to run in a background thread once the GUI is visible, so the
+    first conversion does not pay the import cost.
+    """
+    import numpy
+    import pandas
+    import pyproj
+    import matplotlib.figure
+    import matplotlib.path
+
+def coordinates_text(ring):
+    """
+    Formats a ring as the 'x,y ' tuples of a KML coordinates element.
+
+    Args:
+        ring : (n, 2) array of output coordinates
+    """
+    return ''.join(f'{x},{y} ' for x, y in ring.tolist())
+
 def a_b(LAST):
     posibi = ['outer', 'inner']
     if LAST == 'outer':
@@ -246,82 +894,100 @@ def a_b(LAST):
         b = posibi[0]
     return a, b
 
-def write_middle_chuncks(kml_f, poly_list: list[poligoni]):
+def level_bins(levels):
+    """
+    Picks the COLOR_LIST bin of every contour level.
+
+    Returns:
+        tuple : (top of the scale, bin index per level); levels at or above
+                the top use the last color, levels under MIN_SCALE get -1
+    """
+    import numpy as np
+
+    levels = np.asarray(levels)
+    MAX_SCALE_DYN = MAX_SCALE if STATIC else levels.max()
+    steps = np.linspace(MIN_SCALE, MAX_SCALE_DYN, num=429)
+    bins = np.abs(steps[None, :] - levels[:, None]).argmin(axis=1)
+    bins[levels >= MAX_SCALE_DYN] = len(COLOR_LIST) - 1
+    bins[levels < MIN_SCALE] = -1
+    return MAX_SCALE_DYN, bins
+
+def style_text(color, style_id=None):
+    """Formats the line and polygon style of a contour band."""
+    head = f'<Style id="{style_id}">' if style_id else '<Style>'
+    return f'{head}<LineStyle><color>{color}</color><width>1</width></LineStyle><PolyStyle><color>{color}</color><fill>1</fill></PolyStyle></Style>\n'
+
+def write_middle_chuncks(kml_f, geometry: ContourGeometry, parents=None, shared_styles=False):
     """
     Writes the middle chuncks of the KML file.
 
     Args:
         kml_f : file to write the KML to
-        poly_list : list of polygons to write to the KML file
+        geometry : contour rings to write to the KML file
+        parents : result of nest_rings(geometry), computed when not given
+        shared_styles : reference the styles written by write_first_chunk
+                        with styleUrl instead of writing one per placemark
     """
-    MAX_SCALE_DYN = MAX_SCALE if STATIC else max(lev.level for lev in poly_list)
+
+    if parents is None:
+        parents = nest_rings(geometry)
+    levels = geometry.levels
+    MAX_SCALE_DYN, bins = level_bins(levels)
     LAST = 'outer'
 
-    steps = np.linspace(MIN_SCALE, MAX_SCALE_DYN, num=429)
-    for i, pol in enumerate(poly_list):
-        stop = False
-        lev = pol.level
+    for i, lev in enumerate(levels):
+        progress.level(i + 1, len(levels))
         if lev < MIN_SCALE:
             continue
-        ind = min(range(len(steps)), key=lambda i: abs(steps[i] - lev))
-        color = COLOR_LIST[-1] if lev >= MAX_SCALE_DYN else COLOR_LIST[ind]
         kml_f.write('<Placemark>\n')
         kml_f.write(f"<name>Level {i + 1}: Conc({VARIABLE})={lev}</name>\n")
-        kml_f.write(f'<Style><LineStyle><color>{color}</color><width>1</width></LineStyle><PolyStyle><color>{color}</color><fill>1</fill></PolyStyle></Style>\n')
+        if shared_styles:
+            kml_f.write(f'<styleUrl>#bin{bins[i]}</styleUrl>\n')
+        else:
+            kml_f.write(style_text(COLOR_LIST[bins[i]]))
         kml_f.write(f'<ExtendedData><SchemaData schemaUrl="#{NAME}">\n')
         kml_f.write(f'<SimpleData name=" Conc({VARIABLE})">{lev}</SimpleData>\n')
         kml_f.write('</SchemaData></ExtendedData>\n')
         kml_f.write('<MultiGeometry><Polygon><outerBoundaryIs><LinearRing><coordinates>\n')
         
         LAST = 'outer'
+        rings = geometry.level_rings(i)
+        last = len(rings) - 1
 
         if i == 0:  
-                
-            num_pol = len(pol.poligono)
-            for j, poligon in enumerate(pol.poligono):
-                if j < num_pol - 1 and j > 0:
+            for j, r in enumerate(rings):
+                if j < last and j > 0:
                     a, b = a_b(LAST)
                     LAST = b                    
                     kml_f.write(f'</coordinates></LinearRing></{a}BoundaryIs></Polygon><Polygon><{b}BoundaryIs><LinearRing><coordinates>')                
-                for position in poligon:
-                    kml_f.write(f'{position[0]},{position[1]} ')
+                kml_f.write(coordinates_text(geometry.ring(r)))
         
-        elif i > 0 and i < len(poly_list) - 1:
-            pre = poly_list[i - 1]
-            num_pol = len(pre.poligono)
-            if num_pol == 1:
-                for position in pre.poligono[-1]:
-                    kml_f.write(f'{position[0]},{position[1]} ')
+        elif i > 0 and i < len(levels) - 1:
+            pre = geometry.level_rings(i - 1)
+            if len(pre) == 1:
+                kml_f.write(coordinates_text(geometry.ring(pre[-1])))
                 a, b = a_b(LAST)
                 LAST = b    
                 kml_f.write(f'</coordinates></LinearRing></{a}BoundaryIs></Polygon><Polygon><{b}BoundaryIs><LinearRing><coordinates>')                
-                for poligon in pol.poligono:
-                    for position in poligon:
-                        kml_f.write(f'{position[0]},{position[1]} ')
-                    if poligon != pol.poligono[-1]:
+                for j, r in enumerate(rings):
+                    kml_f.write(coordinates_text(geometry.ring(r)))
+                    if j != last:
                         a, b = a_b(LAST)
                         LAST = b
                         kml_f.write(f'</coordinates></LinearRing></{a}BoundaryIs></Polygon><Polygon><{b}BoundaryIs><LinearRing><coordinates>')
             
-            elif num_pol > 1:
-                for poligon in pol.poligono:
-                    shape_polys = [inside(p, poligon[0]) for p in pre.poligono[:]]
-                    if True in shape_polys:
-                        index_True = shape_polys.index(True)
-                        pre_pol = pre.poligono[index_True]
-                        for position in pre_pol:
-                            kml_f.write(f'{position[0]},{position[1]} ')
+            elif len(pre) > 1:
+                for j, r in enumerate(rings):
+                    if parents[r] >= 0:
+                        kml_f.write(coordinates_text(geometry.ring(parents[r])))
                         a, b = a_b(LAST)
                         LAST = b
                         kml_f.write(f'</coordinates></LinearRing></{a}BoundaryIs></Polygon><Polygon><{b}BoundaryIs><LinearRing><coordinates>')                        
-                        for position in poligon:
-                            kml_f.write(f'{position[0]},{position[1]} ')
-                    if poligon != pol.poligono[-1]:
+                        kml_f.write(coordinates_text(geometry.ring(r)))
+                    if j != last:
                         a, b = a_b(LAST)
                         LAST = b
                         kml_f.write(f'</coordinates></LinearRing></{a}BoundaryIs></Polygon><Polygon><{b}BoundaryIs><LinearRing><coordinates>')
-        else:
-            stop = True
 
         a, b = a_b(LAST)
         LAST = b
@@ -338,6 +1004,9 @@ def make_scale(dx, sx, file_name, MAX_SCALE_DYN = MAX_SCALE):
         sx : the bottom point of the grid in the x-axis on the left
         file_name : the name of the KML scale file
         MAX_SCALE_DYN : the maximum of scale
+
+    Returns:
+        str : the scale KML text
     """
 
     list_x = [dx[0] + (sx[0]- dx[0])*(i/50) + X_SHIFT for i in range(51)]
@@ -364,7 +1033,7 @@ def make_scale(dx, sx, file_name, MAX_SCALE_DYN = MAX_SCALE):
         stringa = '\n'.join(points)
         strings.append(stringa)
         
-    with open(os.path.join('configurations', 'scale_new_new_color.txt'), 'r') as f:
+    with open(resourcePath(os.path.join('configurations', 'scale_new_new_color.txt')), 'r') as f:
         base = f.read()
     for i, stringo in enumerate(strings):
         base = base.replace(f'[coord_{i}]', stringo)
@@ -401,23 +1070,170 @@ def make_scale(dx, sx, file_name, MAX_SCALE_DYN = MAX_SCALE):
         base = base.replace(f'[point_{i}]', point_str)
     base = base.replace("[name_file]", os.path.basename(file_name).replace('.kml', '_scale.kml'))
     scale_name = str(file_name).replace('.kml', '_scale.kml')
-    with open(scale_name, 'w') as f:
-        f.write(base)
+    write_output(scale_name, base)
+    return base
 
 def value(max,min,i):
     return round(min + (max - min)*(i/6),6)
 
-def from_csv_to_kml_configurated(csv_file, configuration, kml_file_name =None):
+# RGBA lookup tables of palette_rgba by palette
+_palette_cache = {}
+
+def palette_rgba():
     """
-    Reads a CSV file and writes a KML file.
+    Returns COLOR_LIST as an (n, 4) uint8 RGBA lookup table.
+
+    KML colors are aabbggrr, so the channels are reordered once here.
+    """
+    import numpy as np
+
+    key = tuple(COLOR_LIST)
+    if key not in _palette_cache:
+        _palette_cache[key] = np.array([[int(c[6:8], 16), int(c[4:6], 16), int(c[2:4], 16), int(c[0:2], 16)]
+                                        for c in COLOR_LIST], dtype=np.uint8)
+    return _palette_cache[key]
+
+def grid_to_rgba(Z, max_scale):
+    """
+    Colors every cell with the palette bin write_middle_chuncks would use for its value.
+
+    Cells not above MIN_SCALE, and NaN cells, are transparent.
 
     Args:
-        csv_file : the CSV file to read
-        kml_file : the KML file to write
+        Z : values, any shape
+        max_scale : value mapped to the last color; larger values use it too
+
+    Returns:
+        array : uint8 RGBA of shape Z.shape + (4,)
+    """
+    import numpy as np
+
+    lut = palette_rgba()
+    bins = 428
+    span = max_scale - MIN_SCALE
+    position = (Z - MIN_SCALE) * (bins / span) if span > 0 else np.full(Z.shape, float(bins))
+    # Nearest of the linspace(MIN_SCALE, max_scale, 429) steps, ties to the lower one like argmin
+    index = np.clip(np.nan_to_num(np.ceil(position - 0.5), nan=0), 0, bins).astype(np.intp)
+    index[Z >= max_scale] = len(lut) - 1
+    rgba = lut[index]
+    rgba[~(Z > MIN_SCALE)] = 0
+    return rgba
+
+def nearest_index(axis, values):
+    """
+    Index of the nearest node of a sorted axis for every value, -1 outside the axis.
+    """
+    import numpy as np
+
+    index = np.clip(np.searchsorted(axis, values), 1, len(axis) - 1)
+    index -= values - axis[index - 1] < axis[index] - values
+    index[(values < axis[0]) | (values > axis[-1])] = -1
+    return index
+
+def rasterize_grid(list_x, list_y, Z):
+    """
+    Resamples a grid onto a north-up lon/lat image of the same size.
+
+    Every pixel center is projected back to input coordinates and takes the
+    nearest grid value, so UTM grids are warped correctly; pixels outside
+    the grid are NaN.
+
+    Returns:
+        tuple : (values indexed [row from north, column from west],
+                 [west, east, south, north] outer edges of the image)
+    """
+    import numpy as np
+
+    ny, nx = Z.shape
+    lon_min, lon_max, lat_min, lat_max = grid_extent(list_x, list_y)
+    lons = np.linspace(lon_min, lon_max, nx)
+    lats = np.linspace(lat_max, lat_min, ny)
+    x, y = converter_DEC_UTM(*np.meshgrid(lons, lats))
+    ix = nearest_index(np.asarray(list_x, dtype=float), x)
+    iy = nearest_index(np.asarray(list_y, dtype=float), y)
+    image = Z[iy, ix].astype(compute_dtype(Z))
+    image[(ix < 0) | (iy < 0)] = np.nan
+    half_x = (lon_max - lon_min) / max(nx - 1, 1) / 2
+    half_y = (lat_max - lat_min) / max(ny - 1, 1) / 2
+    return image, [lon_min - half_x, lon_max + half_x, lat_min - half_y, lat_max + half_y]
+
+def ground_overlay_kml(image_name, scale_name, box):
+    """Builds the KML document of a raster output: one GroundOverlay and a link to the legend."""
+    west, east, south, north = box
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        '<kml xmlns="http://www.opengis.net/kml/2.2">\n'
+        '<Document>\n'
+        f'<name>{NAME}</name>\n'
+        '<GroundOverlay>\n'
+        f'\t<name>Conc({VARIABLE})</name>\n'
+        f'\t<Icon><href>{image_name}</href></Icon>\n'
+        '\t<LatLonBox>\n'
+        f'\t\t<north>{north}</north>\n'
+        f'\t\t<south>{south}</south>\n'
+        f'\t\t<east>{east}</east>\n'
+        f'\t\t<west>{west}</west>\n'
+        '\t</LatLonBox>\n'
+        '</GroundOverlay>\n'
+        '<NetworkLink>\n'
+        '\t<name>Scale</name>\n'
+        f'\t<Link><href>{scale_name}</href></Link>\n'
+        '</NetworkLink>\n'
+        '</Document>\n'
+        '</kml>\n'
+    )
+
+def write_grid_kmz(list_x, list_y, Z, kml_file, lim):
+    """
+    Writes a grid as a colored PNG GroundOverlay packaged with its legend in a KMZ.
+
+    The KMZ replaces kml_file (same name, .kmz); the scale KML is also
+    written next to it as in the vector mode.
+
+    Args:
+        list_x, list_y : sorted grid axes in input coordinates
+        Z : values indexed [y, x]
+        kml_file : the KML file name the vector mode would write
+        lim : extent used to place the legend, as from grid_extent
+    """
+    import zipfile
+    import numpy as np
+    from matplotlib import image as mpimage
+
+    with stage('rasterize'):
+        image, box = rasterize_grid(list_x, list_y, Z)
+        max_scale = MAX_SCALE if STATIC else float(np.nanmax(Z))
+        rgba = grid_to_rgba(image, max_scale)
+        del image
+    with stage('scale'):
+        scale_text = make_scale((lim[0], lim[2]), (lim[1], lim[2]), kml_file, max_scale)
+    with stage('encode'):
+        png = io.BytesIO()
+        # Fast zlib level: most of the image is transparent and compresses well anyway
+        mpimage.imsave(png, rgba, format='png', pil_kwargs={'compress_level': 3})
+        stem = os.path.basename(str(kml_file)).replace('.kml', '')
+        kmz = io.BytesIO()
+        with zipfile.ZipFile(kmz, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('doc.kml', ground_overlay_kml(f'{stem}.png', f'{stem}_scale.kml', box))
+            archive.writestr(f'{stem}.png', png.getvalue(), compress_type=zipfile.ZIP_STORED)
+            archive.writestr(f'{stem}_scale.kml', scale_text)
+        write_output(str(kml_file).replace('.kml', '.kmz'), kmz.getvalue())
+    note(grid=[Z.shape[1], Z.shape[0]])
+    if PROFILE:
+        note(output_bytes=len(kmz.getvalue()) + len(scale_text.encode()))
+    return True
+
+def apply_configuration(configuration):
+    """
+    Sets the module settings from a configuration tuple.
+
+    Args:
+        configuration : (levels, variable, zone, projin, projout, static,
+                         max_scale, min_scale, x_col, y_col, val_col, scale,
+                         base, x_shift, y_shift, x_scale_factor, y_scale_factor)
     """
     global LEVELS
     global VARIABLE
-    global NAME 
     global ZONE
     global PROJIN
     global PROJOUT
@@ -454,30 +1270,466 @@ def from_csv_to_kml_configurated(csv_file, configuration, kml_file_name =None):
     Y_SCALE_FACTOR = configuration[16]
 
     get_proj()
+
+def active_window(Z, threshold):
+    """
+    Finds the bounding box of the cells above a threshold.
+
+    The box is padded by one cell on every side where the grid allows it,
+    so the contours of the active region close on below-threshold cells.
+
+    Args:
+        Z : values indexed [y, x]
+        threshold : cells must be strictly above it to be active
+
+    Returns:
+        tuple : (y slice, x slice), or None when no cell is active
+    """
+    import numpy as np
+
+    active = Z > threshold
+    rows = np.flatnonzero(active.any(axis=1))
+    if rows.size == 0:
+        return None
+    cols = np.flatnonzero(active.any(axis=0))
+    return (slice(max(rows[0] - 1, 0), min(rows[-1] + 2, Z.shape[0])),
+            slice(max(cols[0] - 1, 0), min(cols[-1] + 2, Z.shape[1])))
+
+def frame_fingerprint(list_x, list_y, Z, lim, quantum=0.0, shared_styles=False):
+    """
+    Hashes everything the KML of a grid depends on except its name.
+
+    Args:
+        list_x, list_y : sorted grid axes, after cropping
+        Z : values indexed [y, x], after SCALE and cropping
+        lim : extent of the Receptor's Grid, as from grid_extent
+        quantum : when above 0, values are compared rounded to multiples of
+                  it, so nearly identical grids hash the same
+        shared_styles : as in write_grid_kml
+
+    Returns:
+        str : hex digest
+    """
+    import hashlib
+    import numpy as np
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((VARIABLE, ZONE, PROJIN, PROJOUT, STATIC, MAX_SCALE, MIN_SCALE, SCALE, X_SHIFT, Y_SHIFT,
+                        X_SCALE_FACTOR, Y_SCALE_FACTOR, tuple(map(float, lim)), quantum, shared_styles,
+                        Z.shape, str(Z.dtype))).encode())
+    digest.update(np.asarray(LEVELS, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(list_x, dtype=float).tobytes())
+    digest.update(np.ascontiguousarray(list_y, dtype=float).tobytes())
+    values = np.ma.filled(Z, np.nan)
+    if quantum > 0:
+        values = np.round(values / quantum)
+    digest.update(np.ascontiguousarray(values).tobytes())
+    return digest.hexdigest()
+
+def clear_rendered():
+    """Drops the documents kept for reuse_frames, releasing their memory."""
+    _rendered.clear()
+
+def write_grid_kml(list_x, list_y, Z, kml_file, clip_bounds=None, clip_crs='input', auto_crop=False,
+                   output_mode='vector', shared_styles=False, reuse_frames=False, frame_quantum=0.0):
+    """
+    Contours a grid and writes the KML and scale files.
+
+    Args:
+        list_x, list_y : sorted grid axes in input coordinates
+        Z : values indexed [y, x]
+        kml_file : the KML file to write
+        clip_bounds, clip_crs : optional clipping box, see clip_grid
+        auto_crop : contour only the cells above MIN_SCALE plus a one-cell
+                    border; the Receptor's Grid keeps the full extent
+        output_mode : 'vector' for contour placemarks, 'raster' for a
+                      GroundOverlay KMZ (see write_grid_kmz)
+        shared_styles : write one Style per used palette bin in the header
+                        and reference it from the placemarks
+        reuse_frames : copy the KML of an identical grid among the last
+                       RENDERED_LIMIT rendered instead of contouring again
+                       (vector mode); see frame_fingerprint
+        frame_quantum : value step under which grids count as identical
+
+    Returns:
+        bool : False when auto_crop found no active cell and nothing was written
+    """
+    global NAME
+
+    if clip_bounds is not None:
+        with stage('clip'):
+            list_x, list_y, Z = clip_grid(list_x, list_y, Z, clip_bounds, clip_crs)
+    with stage('extent'):
+        lim = grid_extent(list_x, list_y)
+    e_ne = (lim[0],lim[2]) 
+    e_nw = (lim[1],lim[2])
+    if auto_crop:
+        with stage('crop'):
+            window = active_window(Z, MIN_SCALE)
+        if window is None:
+            return False
+        rows, cols = window
+        list_x, list_y, Z = list_x[cols], list_y[rows], Z[rows, cols]
+    if output_mode == 'raster':
+        return write_grid_kmz(list_x, list_y, Z, kml_file, lim)
+    if output_mode != 'vector':
+        raise ValueError(f'Unknown output mode: {output_mode}')
+    rendered = None
+    if reuse_frames:
+        with stage('fingerprint'):
+            key = frame_fingerprint(list_x, list_y, Z, lim, frame_quantum, shared_styles)
+        rendered = _rendered.pop(key, None)
+    if rendered is None:
+        geometry = grid_contures(list_x, list_y, Z)
+        progress.check()
+        with stage('nesting'):
+            parents = nest_rings(geometry)
+
+    with stage('write'):
+        if rendered is None:
+            # A reusable document is rendered under a placeholder name
+            name = NAME
+            if reuse_frames:
+                NAME = _NAME_MARK
+            try:
+                kml_f = io.StringIO()
+                # Shared styles: one per palette bin actually used by a written level
+                style_bins = sorted(set(level_bins(geometry.levels)[1].tolist()) - {-1}) if shared_styles else ()
+                write_first_chunk(kml_f, lim, style_bins)
+                MAX_SCALE_DYN = write_middle_chuncks(kml_f, geometry, parents, shared_styles)
+                kml_f.write('</Folder>\n')
+                kml_f.write('</Document>')
+                kml_f.write('</kml>\n')
+                kml_text = kml_f.getvalue()
+                del kml_f
+            finally:
+                NAME = name
+            if reuse_frames:
+                rendered = (os.path.basename(str(kml_file)), kml_text, MAX_SCALE_DYN)
+        else:
+            note(reused=rendered[0])
+        if reuse_frames:
+            # Most recently used last, the oldest is dropped past the limit
+            _rendered[key] = rendered
+            while len(_rendered) > RENDERED_LIMIT:
+                del _rendered[next(iter(_rendered))]
+            _, kml_text, MAX_SCALE_DYN = rendered
+            kml_text = kml_text.replace(_NAME_MARK, NAME)
+        write_output(kml_file, kml_text)
+
+    with stage('scale'):
+        scale_text = make_scale(e_ne, e_nw, kml_file, MAX_SCALE_DYN)
+    if PROFILE:
+        note(output_bytes=len(kml_text.encode()) + len(scale_text.encode()))
+    return True
+
+def from_csv_to_kml_configurated(csv_file, configuration, kml_file_name =None, clip_bounds=None, clip_crs='input',
+                                 auto_crop=False, output_mode='vector', shared_styles=False, float32=False,
+                                 stream_row_groups=False, value_columns=None, column_workers=0):
+    """
+    Reads a CSV file, a Parquet/Feather table or a binary grid (see
+    load_input_grid) and writes a KML file.
+
+    Args:
+        csv_file : the CSV, columnar or binary grid file to read
+        kml_file : the KML file to write
+        clip_bounds : optional (x_min, x_max, y_min, y_max) box to contour
+        clip_crs : 'input' if clip_bounds are in the CSV coordinates,
+                   'wgs84' for (lon_min, lon_max, lat_min, lat_max)
+        auto_crop : contour only the region above MIN_SCALE
+        output_mode : 'vector' or 'raster' (a .kmz with a GroundOverlay)
+        shared_styles : one Style per used palette bin, referenced with styleUrl
+        float32 : read and contour the values in single precision; the
+                  coordinates stay float64
+        stream_row_groups : read Parquet/Feather inputs one row group at a time
+        value_columns : write one KML and scale per listed column instead
+                        of VAL_COL, see columns_to_kml
+        column_workers : processes contouring the value_columns, see columns_to_kml
+    """
+    import numpy as np
+
+    global NAME
+    global ZONE
+
+    apply_configuration(configuration)
     
     NAME = os.path.basename(csv_file).split('.')[0]
+    if csv_file.lower().endswith('.csv'):
+        source_kml = csv_file.lower().replace('.csv', '.kml')
+    else:
+        source_kml = os.path.splitext(csv_file.lower())[0] + '.kml'
     if BASE is None:
-        kml_file = csv_file.lower().replace('.csv', '.kml')
+        kml_file = source_kml
     else:
-        kml_file = os.path.join(BASE, os.path.basename(csv_file).lower().replace('.csv', '.kml'))
+        kml_file = os.path.join(BASE, os.path.basename(source_kml))
 
     timestap = time.time()
     kml_file = kml_file.replace('.kml', f'_{int(timestap)}.kml')
-    dataframe = load_csv_file_conf(csv_file)
-    poly, list_x, list_y = dataframe_contures(dataframe)
-    dataframe = dataframe_manipulation(dataframe)
-    lim = [dataframe['dec_x'].min(), dataframe['dec_x'].max(), dataframe['dec_y'].min(), dataframe['dec_y'].max()]
-    e_ne = (lim[0],lim[2]) 
-    e_nw = (lim[1],lim[2])
-    
     if kml_file_name:
         kml_file = kml_file_name
 
-    with open(kml_file, 'w') as kml_f:
-        write_first_chunk(kml_f, lim)
-        MAX_SCALE_DYN = write_middle_chuncks(kml_f, poly)
-        kml_f.write('</Folder>\n')
-        kml_f.write('</Document>')
-        kml_f.write('</kml>\n')
+    begin_report(kml_file_name or csv_file)
+    if value_columns:
+        options = {'clip_bounds': clip_bounds, 'clip_crs': clip_crs, 'auto_crop': auto_crop,
+                   'output_mode': output_mode, 'shared_styles': shared_styles}
+        return columns_to_kml(csv_file, configuration, kml_file, value_columns, column_workers,
+                              np.float32 if float32 else float, stream_row_groups, options)
+    with stage('parse'):
+        list_x, list_y, Z, zone = load_input_grid(csv_file, np.float32 if float32 else float, stream_row_groups)
+    if zone is not None:
+        ZONE = zone
+    return write_grid_kml(list_x, list_y, Z, kml_file, clip_bounds, clip_crs, auto_crop, output_mode, shared_styles)
+
+def columns_to_kml(table_file, configuration, kml_file, columns, workers=0, dtype=float, stream=False,
+                   options=None):
+    """
+    Writes one KML and scale file per value column of a CSV or columnar table.
+
+    The file is parsed and put on the grid once. Every column is then
+    contoured and written with VARIABLE and VAL_COL set to its name and
+    '_<column>' added to the KML name; with more than one worker the
+    columns are contoured in parallel processes, since the module settings
+    are global.
+
+    Args:
+        table_file : the CSV or Parquet/Feather file to read
+        configuration : the same tuple as from_csv_to_kml_configurated
+        kml_file : KML file name the column names are added to
+        columns : value columns to convert, a repeated column is converted once
+        workers : number of processes, 0 for one per column up to the CPU count
+        dtype, stream : see load_input_grid
+        options : keyword options of write_grid_kml
+
+    Returns:
+        bool : True when at least one KML was written
+    """
+    import re
+
+    if os.path.splitext(table_file)[1].lower() in GRID_SUFFIXES:
+        raise ValueError('Value columns need a CSV, Parquet or Feather input')
+    columns = list(dict.fromkeys(columns))
+    with stage('parse'):
+        if os.path.splitext(table_file)[1].lower() in COLUMNAR_SUFFIXES:
+            dataframe = load_columnar_file(table_file, dtype, stream, columns)
+        else:
+            dataframe = load_csv_file_conf(table_file, dtype, columns)
+        list_x, list_y, grids = dataframe_to_grids(dataframe, columns)
+        del dataframe
+    progress.check()
+
+    jobs = []
+    for column in columns:
+        column_configuration = list(configuration)
+        column_configuration[1] = column_configuration[10] = column
+        safe = re.sub(r'[^\w.-]+', '_', column)
+        jobs.append((tuple(column_configuration), f'{NAME}_{safe}', list_x, list_y, grids.pop(column),
+                     kml_file.replace('.kml', f'_{safe}.kml') if kml_file.endswith('.kml') else f'{kml_file}_{safe}',
+                     options or {}))
+
+    workers = workers or min(len(jobs), os.cpu_count() or 1)
+    if workers <= 1 or len(jobs) == 1:
+        written = False
+        for job in jobs:
+            written = write_column_kml(job) or written
+            progress.log(f'  {job[1]} done')
+        return written
+
+    import multiprocessing
+
+    written = False
+    # Spawned, not forked: the caller may be the GUI with its writer and warm-up threads
+    pool = multiprocessing.get_context('spawn').Pool(workers)
+    try:
+        pending = {pool.apply_async(_column_worker, (job, PROFILE, PROFILE_MEMORY)): job for job in jobs}
+        while pending:
+            next(iter(pending)).wait(0.2)
+            for result in [result for result in pending if result.ready()]:
+                job = pending.pop(result)
+                column_written, reports = result.get()
+                written = written or column_written
+                _profile_reports.extend(reports)
+                progress.log(f'  {job[1]} done')
+            # The workers do not see the reporter: cancellation is checked here, and the
+            # reporter's idle hook keeps a GUI waiting on the pool responsive
+            progress.check()
+        pool.close()
+    except BaseException:
+        # Kills the running columns too, so Cancel and timeouts take effect at once
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return written
+
+def write_column_kml(job):
+    """Contours and writes one value column prepared by columns_to_kml."""
+    global NAME
+
+    configuration, name, list_x, list_y, Z, kml_file, options = job
+    apply_configuration(configuration)
+    NAME = name
+    begin_report(kml_file)
+    return write_grid_kml(list_x, list_y, Z, kml_file, **options)
+
+def _column_worker(job, profile, profile_memory):
+    global _writer
+
+    # A worker process must neither queue on a writer, call the parent's
+    # reporter nor return the parent's profiling reports
+    _writer = None
+    _profile_reports.clear()
+    enable_profiling(profile, profile_memory)
+    with progress.reporting(progress.ProgressReporter()):
+        written = write_column_kml(job)
+    return written, pop_profile_reports()
+
+def grid_to_kml_configurated(list_x, list_y, Z, configuration, kml_file, clip_bounds=None, clip_crs='input',
+                             auto_crop=False, output_mode='vector', shared_styles=False, reuse_frames=False,
+                             frame_quantum=0.0):
+    """
+    Writes a KML file from a grid already in memory.
+
+    Same as from_csv_to_kml_configurated without the CSV round trip; the
+    KML name is taken from kml_file. A float32 Z is contoured in float32.
+
+    Args:
+        list_x, list_y : grid axes in input coordinates (ascending or descending)
+        Z : values indexed [y, x]; SCALE is applied to a copy
+        configuration : the same tuple as from_csv_to_kml_configurated
+        kml_file : the KML file to write
+    """
+    import numpy as np
+
+    global NAME
+
+    apply_configuration(configuration)
+    NAME = os.path.basename(str(kml_file)).split('.')[0]
+    begin_report(kml_file)
+
+    list_x, list_y, Z = prepare_grid(list_x, list_y, Z)
+    return write_grid_kml(list_x, list_y, Z, kml_file, clip_bounds, clip_crs, auto_crop, output_mode,
+                          shared_styles, reuse_frames, frame_quantum)
+
+def prepare_grid(list_x, list_y, Z):
+    """
+    Orders the axes of an in-memory grid ascending and applies SCALE.
+
+    Returns:
+        tuple : (x axis, y axis, values indexed [y, x]); Z is only copied when scaled
+    """
+    import numpy as np
+
+    list_x = np.asarray(list_x, dtype=float)
+    list_y = np.asarray(list_y, dtype=float)
+    if list_x[0] > list_x[-1]:
+        list_x, Z = list_x[::-1], Z[:, ::-1]
+    if list_y[0] > list_y[-1]:
+        list_y, Z = list_y[::-1], Z[::-1, :]
+    if SCALE != 1:
+        Z = Z * SCALE
+    return list_x, list_y, Z
+
+def decimate_grid(list_x, list_y, Z, max_cells=200, method='max'):
+    """
+    Reduces a grid to at most max_cells nodes per side.
+
+    Args:
+        list_x, list_y : sorted grid axes
+        Z : values indexed [y, x]
+        max_cells : largest number of nodes kept along either axis
+        method : 'max' keeps the maximum of every block, so narrow plume
+                 peaks survive; 'stride' keeps every step-th node
+
+    Returns:
+        tuple : (x axis, y axis, values); block axes are the mean block coordinates
+    """
+    import numpy as np
+
+    step = -(-max(len(list_x), len(list_y)) // max_cells)
+    if step <= 1:
+        return list_x, list_y, Z
+    if method == 'stride':
+        return list_x[::step], list_y[::step], Z[::step, ::step]
+    if method != 'max':
+        raise ValueError(f'Unknown decimation method: {method}')
+    starts_x = np.arange(0, len(list_x), step)
+    starts_y = np.arange(0, len(list_y), step)
+    Z = np.maximum.reduceat(np.maximum.reduceat(Z, starts_y, axis=0), starts_x, axis=1)
+    list_x = np.add.reduceat(list_x, starts_x) / np.diff(np.append(starts_x, len(list_x)))
+    list_y = np.add.reduceat(list_y, starts_y) / np.diff(np.append(starts_y, len(list_y)))
+    return list_x, list_y, Z
+
+def preview_grid(list_x, list_y, Z, kml_file, levels=20, max_cells=200, method='max'):
+    """
+    Writes a quick, coarse KML of a prepared grid and summarises it.
+
+    The grid is decimated with decimate_grid and contoured with only
+    levels levels; the module settings must already be applied.
+
+    Args:
+        list_x, list_y, Z : grid with ascending axes, as from dataframe_to_grid
+        kml_file : the preview KML file to write
+        levels : contour levels of the preview
+        max_cells, method : see decimate_grid
+
+    Returns:
+        dict : kml file, full and preview shapes, [min_lon, max_lon, min_lat, max_lat]
+               extent and value range of the full grid
+    """
+    import numpy as np
+
+    global LEVELS
+
+    summary = {
+        'kml': str(kml_file),
+        'shape': Z.shape,
+        'extent': [float(v) for v in grid_extent(list_x, list_y)],
+        'min': float(np.nanmin(Z)),
+        'max': float(np.nanmax(Z)),
+    }
+    with stage('decimate'):
+        list_x, list_y, Z = decimate_grid(list_x, list_y, Z, max_cells, method)
+    summary['preview_shape'] = Z.shape
+    LEVELS = levels
+    write_grid_kml(list_x, list_y, Z, kml_file)
+    return summary
+
+def preview_csv(csv_file, configuration, levels=20, max_cells=200, method='max', kml_file=None):
+    """
+    Previews a CSV file, columnar table or binary grid: see preview_grid.
+
+    Args:
+        csv_file : the CSV, columnar or binary grid file to read
+        configuration : the same tuple as from_csv_to_kml_configurated
+        kml_file : defaults to <name>_preview.kml next to the outputs
+
+    Returns:
+        dict : the preview_grid summary
+    """
+    global NAME
+    global ZONE
+
+    apply_configuration(configuration)
+    NAME = os.path.basename(csv_file).split('.')[0]
+    if kml_file is None:
+        kml_file = os.path.join(BASE or os.path.dirname(csv_file), f'{NAME.lower()}_preview.kml')
+    begin_report(kml_file)
+    with stage('parse'):
+        list_x, list_y, Z, zone = load_input_grid(csv_file)
+    if zone is not None:
+        ZONE = zone
+    return preview_grid(list_x, list_y, Z, kml_file, levels, max_cells, method)
+
+def format_preview(summary):
+    """Formats a preview summary as a few lines for the output log."""
+    lon_min, lon_max, lat_min, lat_max = summary['extent']
+    frame = f' (frame {summary["frame"]})' if 'frame' in summary else ''
+    return (f'  Preview {os.path.basename(summary["kml"])}{frame}: grid {summary["shape"][1]}x{summary["shape"][0]}'
+            f' shown as {summary["preview_shape"][1]}x{summary["preview_shape"][0]}\n'
+            f'    lon {lon_min:.5f} .. {lon_max:.5f}, lat {lat_min:.5f} .. {lat_max:.5f}\n'
+            f'    values {summary["min"]:.4g} .. {summary["max"]:.4g}\n')
+
 
-    make_scale(e_ne, e_nw, kml_file, MAX_SCALE_DYN)
+if __name__ == "__main__":
+    from cli import main
+    sys.exit(main())
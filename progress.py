@@ -0,0 +1,280 @@
+"""
+UI-independent progress and log events of the conversion core.
+
+The core reports through the module functions (log, frame, level); they
+forward to the reporter made active with reporting() and do nothing
+otherwise. A ProgressReporter keeps a bounded log and calls its callbacks
+at most once per interval, so a GUI or terminal is refreshed at a steady
+rate however fast frames and levels go by.
+
+The same calls are the cancellation points: when the reporter was
+cancelled or a file or frame ran past its time limit they raise an
+Interrupted exception, so long runs stop between levels and frames.
+"""
+from __future__ import annotations
+
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass, replace
+from typing import Callable, Optional
+import threading
+import time
+
+
+class Interrupted(Exception):
+    """Base class of the exceptions raised at cancellation points."""
+
+
+class Cancelled(Interrupted):
+    """The whole run was cancelled."""
+
+
+class Skipped(Interrupted):
+    """The current file was skipped on request."""
+
+
+class TimedOut(Interrupted):
+    """The current file ran past its time limit."""
+
+
+class FrameTimedOut(TimedOut):
+    """The current frame ran past its time limit; the rest of the file can go on."""
+
+
+@dataclass
+class ProgressState:
+    """Position of a conversion run; counts are 0 when unknown."""
+    file: str = ''
+    file_index: int = 0
+    file_count: int = 0
+    frame: int = 0
+    frame_count: int = 0
+    level: int = 0
+    level_count: int = 0
+
+
+class ProgressReporter:
+    """
+    Collects progress and log events and forwards them, throttled, to callbacks.
+
+    cancel() and skip() may be called from another thread or a UI callback;
+    they take effect at the next cancellation point. Items given up on are
+    listed in incomplete as (file, frame or None, item or None, reason), item naming
+    e.g. the specie and level of a frame.
+
+    Args:
+        on_progress : called with a ProgressState copy
+        on_log : called with the list of messages logged since the last call
+        on_idle : called at most once per interval from check(), e.g. to let a UI
+            running the conversion on its own thread handle events
+        interval : minimum seconds between two callback rounds
+        log_size : number of messages kept in messages
+    """
+
+    def __init__(self, on_progress: Optional[Callable[[ProgressState], None]] = None,
+                 on_log: Optional[Callable[[list[str]], None]] = None,
+                 on_idle: Optional[Callable[[], None]] = None,
+                 interval: float = 0.2, log_size: int = 1000):
+        self.on_progress = on_progress
+        self.on_log = on_log
+        self.on_idle = on_idle
+        self.interval = interval
+        self.state = ProgressState()
+        self.messages = deque(maxlen=log_size)
+        self._pending = deque(maxlen=log_size)
+        self._last_emit = float('-inf')
+        self._last_idle = float('-inf')
+        self._changed = False
+        self._lock = threading.RLock()
+        self.incomplete = []
+        self._cancelled = False
+        self._skip = False
+        self._file_deadline = None
+        self._file_timeout = None
+        self._frame_deadline = None
+        self._frame_timeout = None
+
+    @property
+    def cancelled(self) -> bool:
+        """True once cancel() was called."""
+        return self._cancelled
+
+    def cancel(self) -> None:
+        """Stops the run at the next cancellation point."""
+        self._cancelled = True
+
+    def skip(self) -> None:
+        """Gives up the current file at the next cancellation point."""
+        self._skip = True
+
+    def check(self) -> None:
+        """Raises the pending Interrupted exception, if any."""
+        now = time.monotonic()
+        if self.on_idle is not None and now - self._last_idle >= self.interval:
+            # Events handled here may cancel or skip, which is raised just below
+            self._last_idle = now
+            self.on_idle()
+        if self._cancelled:
+            raise Cancelled('Cancelled')
+        if self._skip:
+            self._skip = False
+            raise Skipped('Skipped')
+        if self._file_deadline is not None and now > self._file_deadline:
+            self._file_deadline = None
+            raise TimedOut(f'Timed out after {self._file_timeout:g} s')
+        if self._frame_deadline is not None and now > self._frame_deadline:
+            self._frame_deadline = None
+            raise FrameTimedOut(f'Frame timed out after {self._frame_timeout:g} s')
+
+    def record(self, error: Interrupted, item: Optional[str] = None) -> None:
+        """
+        Lists the current file, or frame for FrameTimedOut, as given up on.
+
+        Args:
+            item : what part of the frame was given up on, e.g. 'PM10_L0'
+        """
+        frame = self.state.frame if isinstance(error, FrameTimedOut) else None
+        self.incomplete.append((self.state.file, frame, item, str(error)))
+
+    def start_file(self, file: str, index: int, count: int, timeout: Optional[float] = None) -> None:
+        """
+        Moves to the next input file and refreshes the callbacks immediately.
+
+        Args:
+            timeout : seconds the file may take, None for no limit
+        """
+        with self._lock:
+            self.state = ProgressState(file=str(file), file_index=index, file_count=count)
+            self._skip = False
+            self._file_timeout = timeout
+            self._file_deadline = time.monotonic() + timeout if timeout else None
+            self._frame_deadline = None
+            self._changed = True
+            self.flush()
+        self.check()
+
+    def frame(self, index: int, count: int, timeout: Optional[float] = None) -> None:
+        """
+        Reports frame index (1-based) of count within the current file.
+
+        Args:
+            timeout : seconds the frame may take, None for no limit
+        """
+        with self._lock:
+            self.state.frame, self.state.frame_count = index, count
+            self.state.level = self.state.level_count = 0
+            self._frame_deadline = None
+            self._changed = True
+            self._maybe_emit()
+        self.check()
+        self._frame_timeout = timeout
+        self._frame_deadline = time.monotonic() + timeout if timeout else None
+
+    def restart(self, timeout: Optional[float] = None) -> None:
+        """
+        Gives the next item of the current frame, e.g. one of several maps, a fresh time budget.
+
+        Args:
+            timeout : seconds the item may take, None for no limit
+        """
+        self._frame_deadline = None
+        self.check()
+        self._frame_timeout = timeout
+        self._frame_deadline = time.monotonic() + timeout if timeout else None
+
+    def level(self, index: int, count: int) -> None:
+        """Reports contour level index (1-based) of count within the current file or frame."""
+        with self._lock:
+            self.state.level, self.state.level_count = index, count
+            self._changed = True
+            self._maybe_emit()
+        self.check()
+
+    def log(self, message: str) -> None:
+        """Adds a message to the log; it reaches on_log with the next callback round."""
+        with self._lock:
+            self.messages.append(message)
+            self._pending.append(message)
+            self._maybe_emit()
+
+    def flush(self) -> None:
+        """Forwards the pending messages and the current state now."""
+        with self._lock:
+            self._last_emit = time.monotonic()
+            if self._pending and self.on_log:
+                messages = list(self._pending)
+                self._pending.clear()
+                self.on_log(messages)
+            if self._changed and self.on_progress:
+                self._changed = False
+                self.on_progress(replace(self.state))
+
+    def _maybe_emit(self) -> None:
+        if time.monotonic() - self._last_emit >= self.interval:
+            self.flush()
+
+
+_active = None
+
+
+@contextmanager
+def reporting(reporter: ProgressReporter):
+    """Makes reporter receive the events of the enclosed conversions, flushing it on exit."""
+    global _active
+    previous, _active = _active, reporter
+    try:
+        yield reporter
+    finally:
+        _active = previous
+        reporter.flush()
+
+
+def current() -> Optional[ProgressReporter]:
+    """Returns the active reporter, or None."""
+    return _active
+
+
+def log(message: str) -> None:
+    """Logs a message on the active reporter."""
+    if _active is not None:
+        _active.log(message)
+
+
+def frame(index: int, count: int, timeout: Optional[float] = None) -> None:
+    """Reports frame progress on the active reporter; a cancellation point."""
+    if _active is not None:
+        _active.frame(index, count, timeout)
+
+
+def restart(timeout: Optional[float] = None) -> None:
+    """Starts a fresh frame time budget on the active reporter; a cancellation point."""
+    if _active is not None:
+        _active.restart(timeout)
+
+
+def level(index: int, count: int) -> None:
+    """Reports contour level progress on the active reporter; a cancellation point."""
+    if _active is not None:
+        _active.level(index, count)
+
+
+def check() -> None:
+    """Cancellation point between stages."""
+    if _active is not None:
+        _active.check()
+
+
+def record(error: Interrupted, item: Optional[str] = None) -> None:
+    """Records an interrupted item on the active reporter."""
+    if _active is not None:
+        _active.record(error, item)
+
+
+def describe(state: ProgressState) -> str:
+    """Formats a state as a one-line status, e.g. 'a.nc - Frame 3/24 - Level 120/400'."""
+    parts = [state.file.replace('\\', '/').rsplit('/', 1)[-1]]
+    if state.frame_count:
+        parts.append(f'Frame {state.frame}/{state.frame_count}')
+    if state.level_count:
+        parts.append(f'Level {state.level}/{state.level_count}')
+    return ' - '.join(parts)
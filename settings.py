@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from typing import Optional
+import json
+
+
+@dataclass
+class AppConfig:
+    """Application configuration settings."""
+    levels: int = 400
+    variable: str = 'Odor'
+    zone: str = '32'
+    projin: str = 'utm'
+    projout: str = 'WGS84'
+    static: bool = False
+    max_scale: int = 130
+    min_scale: int = 0
+    x_col: str = 'x_km'
+    y_col: str = 'y_km'
+    val_col: str = 'value'
+    scale: float = 1.0
+    base: Optional[str] = None
+    x_shift: float = 0.0
+    y_shift: float = 0.0
+    x_scale_factor: float = 1.0
+    y_scale_factor: float = 1.0
+    clip_bounds: Optional[list[float]] = None  # [x_min, x_max, y_min, y_max]
+    clip_crs: str = 'input'  # 'input' or 'wgs84'
+    auto_crop: bool = False  # contour only the cells above min_scale
+    file_timeout: Optional[float] = None  # seconds per file, None for no limit
+    output_mode: str = 'vector'  # 'vector' contours or 'raster' GroundOverlay KMZ
+    shared_styles: bool = False  # one Style per palette bin, referenced with styleUrl
+    float32: bool = False  # compute grid values in single precision, coordinates stay float64
+    stream_row_groups: bool = False  # read Parquet/Feather inputs one row group at a time
+    value_columns: list[str] = field(default_factory=list)  # one KML per column instead of val_col
+    column_workers: int = 0  # processes for value_columns, 0 for one per column up to the CPU count
+    profile: bool = False
+    profile_report: Optional[str] = None
+    file_list: list[str] = field(default_factory=list)
+    config_window_open: bool = False
+
+
+@dataclass
+class SprayConfig:
+    """Spray .nc file configuration settings."""
+    specie: int = 0  # NO2 = 0, PM10 = 1
+    level: int = 0
+    species: list[int] = field(default_factory=list)  # several species in one pass, overrides specie
+    vertical_levels: list[int] = field(default_factory=list)  # several levels in one pass, overrides level
+    specie_names: list[str] = field(default_factory=list)  # KML variable name of every specie index
+    tot_specie: int = 4
+    cut_map: bool = False
+    lat_min: float = 44.371366
+    lat_max: float = 44.492199
+    lon_min: float = 8.807603
+    lon_max: float = 9.039093
+    easting_start: int = 484671
+    northing_start: int = 4913138
+    easting_end: int = 503097
+    northing_end: int = 4926569
+    zone : str = '32'
+    norm_value: bool = False
+    cut_date: bool = False
+    date: str = '2024-12-17 15:00'
+    date_after_good: str = '2024-12-17 15:00'
+    colors: str = 'log'  # 'norm' or 'log'
+    kml_output: bool = True
+    kml_output_dir: str = 'kml_output'
+    scale_output: bool = True
+    scale_orientation: str = 'vertical'  # 'horizontal' or 'vertical'
+    multiplier: float = 1.0
+    prefetch_frames: int = 2  # frames read ahead of contouring, 0 reads synchronously
+    reductions: list[str] = field(default_factory=list)  # 'mean', 'max', 'percentile', 'hours_above'
+    reduction_window: int = 24  # hours per reduction window from midnight, 0 for the whole file
+    percentile: float = 98.0
+    histogram_bins: int = 100  # percentile histogram bins per cell
+    histogram_max: float = 0.0  # top of the percentile histogram, 0 for kml_max_scale / kml_scale
+    reduction_threshold: float = 0.0  # hours_above counts frames above this scaled value
+    auto_scale: str = ''  # 'max' or 'pNN': pre-scan the batch and set a static kml_max_scale
+    scan_chunk_frames: int = 24  # frames per read of the pre-scan
+    reuse_frames: bool = False  # copy the KML of an identical earlier frame instead of contouring
+    frame_quantum: float = 0.0  # value step under which frames count as identical, 0 for exact
+    file_timeout: Optional[float] = None  # seconds per file, None for no limit
+    frame_timeout: Optional[float] = None  # seconds per frame, None for no limit
+    # KML generation parameters
+    kml_levels: int = 400
+    kml_level_values: list[float] = field(default_factory=list)  # explicit contour levels of this run, set by auto_scale
+    kml_variable: str = 'Spray'
+    kml_static: bool = False
+    kml_max_scale: float = 100
+    kml_min_scale: int = 0
+    kml_scale: float = 1.0
+    kml_x_shift: float = 0.0
+    kml_y_shift: float = 0.0
+    kml_x_scale_factor: float = 1.0
+    kml_y_scale_factor: float = 1.0
+    auto_crop: bool = True  # contour only the cells above kml_min_scale
+    output_mode: str = 'vector'  # 'vector' contours or 'raster' GroundOverlay KMZ
+    shared_styles: bool = False  # one Style per palette bin, referenced with styleUrl
+    float32: bool = False  # compute grid values in single precision, coordinates stay float64
+    profile: bool = False
+    profile_report: Optional[str] = None
+    file_list: list[str] = field(default_factory=list)
+    spray_config_window_open: bool = False
+    kml_config_window_open: bool = False
+
+
+# Fields that only track GUI state and are never written to configuration files
+APP_RUNTIME_FIELDS = ('file_list', 'config_window_open')
+# kml_level_values only holds the levels of the auto_scale pre-scan of the current run
+SPRAY_RUNTIME_FIELDS = ('file_list', 'spray_config_window_open', 'kml_config_window_open', 'kml_level_values')
+
+
+def config_to_dict(config: AppConfig | SprayConfig) -> dict:
+    """Return the persistent fields of a configuration as a plain dict."""
+    runtime = SPRAY_RUNTIME_FIELDS if isinstance(config, SprayConfig) else APP_RUNTIME_FIELDS
+    return {name: value for name, value in vars(config).items() if name not in runtime}
+
+
+def update_config(config: AppConfig | SprayConfig, config_dict: dict) -> None:
+    """Update a configuration in place from a dict, ignoring unknown keys."""
+    for name, value in config_to_dict(config).items():
+        setattr(config, name, config_dict.get(name, value))
+
+
+def save_config(config: AppConfig | SprayConfig, filename: str) -> None:
+    """Write a configuration to a JSON file."""
+    with open(filename, 'w') as f:
+        json.dump(config_to_dict(config), f, indent=4)
+
+
+def load_config(config: AppConfig | SprayConfig, filename: str) -> None:
+    """Update a configuration in place from a JSON file."""
+    with open(filename, 'r') as f:
+        update_config(config, json.load(f))
+
+
+def csv_params(config: AppConfig) -> tuple:
+    """Build the configuration tuple expected by from_csv_to_kml_configurated."""
+    return (
+        config.levels, config.variable, config.zone,
+        config.projin, config.projout, config.static,
+        config.max_scale, config.min_scale, config.x_col,
+        config.y_col, config.val_col, config.scale,
+        config.base, config.x_shift, config.y_shift,
+        config.x_scale_factor, config.y_scale_factor
+    )
+
+
+def csv_options(config: AppConfig) -> dict:
+    """Build the keyword options of from_csv_to_kml_configurated."""
+    return {
+        'clip_bounds': config.clip_bounds,
+        'clip_crs': config.clip_crs,
+        'auto_crop': config.auto_crop,
+        'output_mode': config.output_mode,
+        'shared_styles': config.shared_styles,
+        'float32': config.float32,
+        'stream_row_groups': config.stream_row_groups,
+        'value_columns': config.value_columns,
+        'column_workers': config.column_workers,
+    }
+
+
+def parse_bounds(text: str) -> Optional[list[float]]:
+    """Parse 'min_x, max_x, min_y, max_y' into a list of floats; empty text means no bounds."""
+    if not text.strip():
+        return None
+    bounds = [float(v) for v in text.replace(';', ',').split(',')]
+    if len(bounds) != 4:
+        raise ValueError('Bounds need four values: min_x, max_x, min_y, max_y')
+    return bounds
+
+
+def parse_timeout(text: str) -> Optional[float]:
+    """Parse a timeout in seconds; empty text, 0 or None means no limit."""
+    if not text.strip() or text.strip() == 'None':
+        return None
+    seconds = float(text)
+    if seconds < 0:
+        raise ValueError('Timeouts cannot be negative')
+    return seconds or None
+
+
+def parse_int_list(text: str) -> list[int]:
+    """Parse '0, 1, 3' into a list of ints; empty text means an empty list."""
+    return [int(part) for part in text.replace(';', ',').split(',') if part.strip()]
+
+
+def spray_kml_params(config: SprayConfig) -> tuple:
+    """Build the configuration tuple used for Spray frames."""
+    return (
+        config.kml_level_values or config.kml_levels,  # levels
+        config.kml_variable,  # variable
+        config.zone,  # zone (not used for latlong)
+        'latlong',  # projin - geographic coordinates
+        'WGS84',  # projout
+        config.kml_static,  # static
+        config.kml_max_scale,  # max_scale
+        config.kml_min_scale,  # min_scale
+        'x_km',  # x_col
+        'y_km',  # y_col
+        'value',  # val_col
+        config.kml_scale,  # scale
+        config.kml_output_dir,  # base output directory
+        config.kml_x_shift,  # x_shift
+        config.kml_y_shift,  # y_shift
+        config.kml_x_scale_factor,  # x_scale_factor
+        config.kml_y_scale_factor   # y_scale_factor
+    )
@@ -0,0 +1,610 @@
+from __future__ import annotations
+
+from datetime import datetime
+from pathlib import Path
+import os
+import queue
+import re
+import threading
+
+from main import axis_window, clear_rendered, grid_to_kml_configurated
+import progress
+from settings import SprayConfig, spray_kml_params
+
+# Temporal reductions of process_spray_file, see WindowStatistics
+REDUCTIONS = ('mean', 'max', 'percentile', 'hours_above')
+
+# Domain geometry per (zone, extents, grid shape, cut bounds), reused across files of a batch
+_domain_cache = {}
+
+
+def spray_domain(config: SprayConfig, nlat: int, nlon: int) -> tuple:
+    """
+    Builds the lat/lon axes of a Spray grid and the cut_map window, cached per domain.
+
+    Args:
+        config : Spray configuration (zone, UTM extents and cut bounds)
+        nlat, nlon : grid shape of the concentration variable
+
+    Returns:
+        tuple : (latitudes, longitudes, lat slice, lon slice); the axes are already
+                cut and must not be modified
+    """
+    cut = (config.lat_min, config.lat_max, config.lon_min, config.lon_max) if config.cut_map else None
+    key = (config.zone, config.easting_start, config.northing_start, config.easting_end,
+           config.northing_end, nlat, nlon, cut)
+    if key not in _domain_cache:
+        import numpy as np
+        from pyproj import Proj, Transformer
+
+        # Get lat/lon grid from UTM coordinates
+        utm_proj = Proj(proj='utm', zone=int(config.zone), ellps='WGS84')
+        geo_proj = Proj(proj='latlong', datum='WGS84')
+        transformer = Transformer.from_proj(utm_proj, geo_proj)
+
+        lon_start, lat_start = transformer.transform(config.easting_start, config.northing_start)
+        lon_end, lat_end = transformer.transform(config.easting_end, config.northing_end)
+
+        latitudes = np.linspace(lat_start, lat_end, nlat)
+        longitudes = np.linspace(lon_start, lon_end, nlon)
+
+        # Apply subsetting to lat/lon if needed
+        if cut:
+            lat_slice = axis_window(latitudes, config.lat_min, config.lat_max)
+            lon_slice = axis_window(longitudes, config.lon_min, config.lon_max)
+            if lat_slice.start >= lat_slice.stop or lon_slice.start >= lon_slice.stop:
+                raise ValueError('No grid points found within the specified lat/lon bounds')
+            latitudes = latitudes[lat_slice]
+            longitudes = longitudes[lon_slice]
+        else:
+            lat_slice = slice(None)
+            lon_slice = slice(None)
+        latitudes.flags.writeable = False
+        longitudes.flags.writeable = False
+        _domain_cache[key] = (latitudes, longitudes, lat_slice, lon_slice)
+    return _domain_cache[key]
+
+
+def read_ahead(read, items, depth: int):
+    """
+    Yields read(item) for every item, reading up to depth items ahead on a thread.
+
+    The reader thread stays at most depth results ahead, so memory is bounded
+    by the queue size; depth 0 reads synchronously. Exceptions raised by read
+    are re-raised in the consumer. Closing the generator stops the reader.
+
+    Args:
+        read : callable reading one item
+        items : the items to read, in order
+        depth : number of results buffered ahead of the consumer
+    """
+    if depth <= 0:
+        for item in items:
+            yield read(item)
+        return
+
+    buffer = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def reader():
+        for item in items:
+            try:
+                result = (read(item), None)
+            except Exception as e:
+                result = (None, e)
+            while not stop.is_set():
+                try:
+                    buffer.put(result, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
+            if stop.is_set() or result[1] is not None:
+                return
+
+    thread = threading.Thread(target=reader, name='spray-read-ahead', daemon=True)
+    thread.start()
+    try:
+        for _ in items:
+            result, error = buffer.get()
+            if error is not None:
+                raise error
+            yield result
+    finally:
+        stop.set()
+        thread.join()
+
+
+def combinations(config: SprayConfig) -> list[tuple[int, int]]:
+    """(specie, level) pairs to extract: the species and vertical_levels lists, or specie and level."""
+    return [(specie, level) for specie in config.species or [config.specie]
+            for level in config.vertical_levels or [config.level]]
+
+
+def aggregate_frame(concentration, t: int, species: list[int], levels: list[int], tot_specie: int,
+                    lat_slice: slice, lon_slice: slice, dtype=None):
+    """
+    Reads frame t as one hyperslab and sums every source of each specie at each level.
+
+    All the species of all the sources and levels are read in one request,
+    then reduced over the sources in a single vectorized sum. A cell is
+    masked when any source has it masked.
+
+    Args:
+        t : frame index, or a slice of frames, which adds a leading frame axis
+        species, levels : sorted, distinct specie and level indices
+        tot_specie : number of species per source
+        dtype : type to sum in, the variable's own type when None
+
+    Returns:
+        array : sums indexed [specie, level, lat, lon], or [frame, specie, level, lat, lon]
+    """
+    import numpy as np
+
+    num_sources = concentration.shape[1] // tot_specie
+    idxs = [specie + i * tot_specie for i in range(num_sources) for specie in species]
+    # Aggregate concentrations from all sources (using same logic as cut_filer_json_kml.py)
+    block = concentration[t, idxs, levels, lat_slice, lon_slice]
+    lead = block.shape[:-4]
+    block = block.reshape(lead + (num_sources, len(species)) + block.shape[-3:])
+    total = np.add.reduce(np.ma.getdata(block), axis=len(lead), dtype=dtype)
+    if np.ma.is_masked(block):
+        return np.ma.masked_array(total, mask=np.ma.getmaskarray(block).any(axis=len(lead)))
+    return total
+
+
+class WindowStatistics:
+    """
+    Per-cell statistics of the frames of one reduction window, updated frame by frame.
+
+    Only the arrays of the requested reductions are kept: a running sum,
+    maximum or count above the threshold, one value per cell. The
+    percentile comes from a per-cell histogram of histogram_bins bins
+    starting at 0 to histogram_max (kml_max_scale / kml_scale when 0).
+    When a frame reaches the top, the top is doubled by merging pairs of
+    bins, so peaks above it are still binned rather than all answered
+    with the cell maximum. The estimate is interpolated inside the bin:
+    its error is at most one bin width of the final top, and its memory
+    histogram_bins counters per cell.
+
+    Args:
+        config : Spray configuration with the reductions settings
+        shape : shape of the frame grids
+    """
+
+    def __init__(self, config: SprayConfig, shape: tuple):
+        import numpy as np
+
+        self.config = config
+        self.frames = 0
+        reductions = set(config.reductions)
+        unknown = reductions - set(REDUCTIONS)
+        if unknown:
+            raise ValueError(f'Unknown reductions: {", ".join(sorted(unknown))}')
+        self.sum = np.zeros(shape) if 'mean' in reductions else None
+        self.max = np.full(shape, -np.inf) if reductions & {'max', 'percentile'} else None
+        self.above = np.zeros(shape, dtype=np.uint32) if 'hours_above' in reductions else None
+        self.counts = None
+        if 'percentile' in reductions:
+            self.top = config.histogram_max or config.kml_max_scale / config.kml_scale
+            if self.top <= 0 or config.histogram_bins < 1:
+                raise ValueError('The percentile histogram needs a positive maximum and at least one bin')
+            small = 0 < config.reduction_window <= np.iinfo(np.uint16).max
+            self.counts = np.zeros((config.histogram_bins + 1,) + shape, dtype=np.uint16 if small else np.uint32)
+
+    def add(self, Z) -> None:
+        """Adds one frame of values (after the multiplier, before kml_scale)."""
+        import numpy as np
+
+        self.frames += 1
+        if self.sum is not None:
+            self.sum += Z
+        if self.max is not None:
+            np.maximum(self.max, Z, out=self.max)
+        if self.above is not None:
+            self.above += Z * self.config.kml_scale > self.config.reduction_threshold
+        if self.counts is not None:
+            bins = self.config.histogram_bins
+            peak = float(np.max(Z))
+            while np.isfinite(peak) and peak >= self.top:
+                self._widen()
+            index = np.clip(np.floor(Z * (bins / self.top)), 0, bins).astype(np.intp)
+            # Every cell falls in exactly one bin, so a fancy-indexed increment is safe
+            cells = Z.size
+            self.counts.reshape(-1)[index.ravel() * cells + np.arange(cells)] += 1
+
+    def _widen(self) -> None:
+        """Doubles the histogram top: old bins 2k and 2k + 1 become bin k, which is exact."""
+        import numpy as np
+
+        bins = self.config.histogram_bins
+        pairs = bins // 2
+        merged = np.zeros_like(self.counts)
+        merged[:pairs] = self.counts[0:2 * pairs:2] + self.counts[1:2 * pairs:2]
+        if bins % 2:
+            merged[pairs] = self.counts[bins - 1]
+        merged[bins] = self.counts[bins]
+        self.counts = merged
+        self.top *= 2
+
+    def percentile(self, q: float):
+        """Approximate per-cell q-th percentile of the frames added so far."""
+        import numpy as np
+
+        bins = self.config.histogram_bins
+        cumulative = np.cumsum(self.counts, axis=0, dtype=np.uint32)
+        target = q / 100 * self.frames
+        index = np.minimum((cumulative < target).sum(axis=0), bins)
+        before = np.where(index > 0, np.take_along_axis(cumulative, np.maximum(index - 1, 0)[None], 0)[0], 0)
+        inside = np.take_along_axis(self.counts, index[None], 0)[0]
+        fraction = np.clip((target - before) / np.maximum(inside, 1), 0, 1)
+        value = np.minimum((index + fraction) * (self.top / bins), self.max)
+        return np.where(index == bins, self.max, value)
+
+    def results(self) -> list[tuple[str, object, bool]]:
+        """
+        Returns:
+            list : (name, grid, True when the grid is in concentration units and
+                   kml_scale applies) for every requested reduction
+        """
+        config = self.config
+        results = []
+        for reduction in config.reductions:
+            if reduction == 'mean':
+                results.append(('mean', self.sum / self.frames, True))
+            elif reduction == 'max':
+                results.append(('max', self.max, True))
+            elif reduction == 'percentile':
+                results.append((f'p{config.percentile:g}', self.percentile(config.percentile), True))
+            else:
+                results.append((f'hours_above_{config.reduction_threshold:g}', self.above, False))
+        return results
+
+
+def combo_variable(config: SprayConfig, specie: int, level: int) -> str:
+    """
+    Variable name of one (specie, level) combination, used in its KML labels and file names.
+
+    A single combination keeps kml_variable. With species or
+    vertical_levels lists the specie name (from specie_names, else
+    '<kml_variable>_S<specie>') and the level are added, e.g. 'PM10_L0'.
+    """
+    if not (config.species or config.vertical_levels):
+        return config.kml_variable
+    if specie < len(config.specie_names) and config.specie_names[specie]:
+        name = config.specie_names[specie]
+    else:
+        name = f'{config.kml_variable}_S{specie}'
+    return f'{name}_L{level}'
+
+
+def wanted_frames(config: SprayConfig, time_frames: int) -> list[int]:
+    """Frames converted from a file of time_frames frames: all of them, or those from date_after_good with cut_date."""
+    start_time = datetime.strptime(config.date, '%Y-%m-%d %H:%M').timestamp()
+    good_time = datetime.strptime(config.date_after_good, '%Y-%m-%d %H:%M').timestamp()
+    return [t for t in range(time_frames) if not (config.cut_date and start_time + t * 3600 < good_time)]
+
+
+def scan_spray_files(config: SprayConfig, files: list[str], quantiles=(0.5, 0.9, 0.99, 0.999),
+                     chunk_frames: int = 24) -> dict:
+    """
+    Computes value statistics over every frame a batch would convert, without contouring.
+
+    Frames are read chunk_frames at a time as one hyperslab per chunk and
+    reduced with NumPy. Values are in KML units (multiplier and kml_scale
+    applied) over all the (specie, level) combinations. The quantiles are
+    those of the active cells, above kml_min_scale, read from a
+    logarithmic histogram of 200 bins per decade, so they are rounded up
+    by at most 1.2%.
+
+    Args:
+        config : Spray configuration
+        files : the .nc files of the batch
+        quantiles : quantiles to compute, between 0 and 1
+        chunk_frames : frames read per request
+
+    Returns:
+        dict : 'min', 'max', 'frames', 'active' cell count and 'quantiles' {q: value};
+               quantiles are None when no cell is active
+    """
+    import numpy as np
+    from netCDF4 import Dataset
+
+    per_decade, low, high = 200, -12, 12
+    counts = np.zeros((high - low) * per_decade, dtype=np.int64)
+    lowest, highest, frames = np.inf, -np.inf, 0
+    combos = combinations(config)
+    species = sorted({specie for specie, _ in combos})
+    levels = sorted({level for _, level in combos})
+    selected = [(species.index(specie), levels.index(level)) for specie, level in combos]
+    for file_path in files:
+        progress.log(f'Scanning {Path(file_path).name}...')
+        with Dataset(file_path) as ds:
+            concentration = ds.variables['concentration']
+            time_frames, _, _, nlat, nlon = concentration.shape
+            _, _, lat_slice, lon_slice = spray_domain(config, nlat, nlon)
+            wanted = wanted_frames(config, time_frames)
+            # The wanted frames are always a run of consecutive frames
+            for start in range(0, len(wanted), chunk_frames):
+                progress.check()
+                chunk = slice(wanted[start], wanted[min(start + chunk_frames, len(wanted)) - 1] + 1)
+                sums = aggregate_frame(concentration, chunk, species, levels, config.tot_specie, lat_slice, lon_slice)
+                values = np.ma.filled(sums, 0)[:, [i for i, _ in selected], [j for _, j in selected]]
+                values = values * (config.multiplier * config.kml_scale)
+                frames += values.shape[0]
+                lowest = min(lowest, float(values.min()))
+                highest = max(highest, float(values.max()))
+                active = values[values > config.kml_min_scale]
+                active = active[active > 0]
+                bins = np.clip(((np.log10(active) - low) * per_decade).astype(np.intp), 0, len(counts) - 1)
+                counts += np.bincount(bins, minlength=len(counts))
+
+    total = int(counts.sum())
+    results = {}
+    if total:
+        cumulative = np.cumsum(counts)
+        for q in quantiles:
+            index = min(int(np.searchsorted(cumulative, q * total)), len(counts) - 1)
+            # Upper edge of the bin, so the quantile is never underestimated, kept inside the observed range
+            value = 10 ** (low + (index + 1) / per_decade)
+            results[q] = min(max(value, config.kml_min_scale), highest)
+    return {'min': lowest, 'max': highest, 'frames': frames, 'active': total,
+            'quantiles': results if total else {q: None for q in quantiles}}
+
+
+def nice_ceiling(value: float) -> float:
+    """Rounds a positive value up to three significant digits, e.g. 87.34 -> 87.4."""
+    import math
+
+    step = 10 ** (math.floor(math.log10(value)) - 2)
+    return round(math.ceil(value / step - 1e-9) * step, 12)
+
+
+def apply_global_scale(config: SprayConfig, files: list[str]) -> str:
+    """
+    Pre-scans a batch and sets a static scale and levels from config.auto_scale.
+
+    auto_scale 'max' uses the global maximum, 'pNN' (e.g. 'p99.5') that
+    percentile of the active cells. kml_static is switched on,
+    kml_max_scale set to the value rounded up to three significant digits
+    and kml_level_values to kml_levels values evenly spaced from
+    kml_min_scale to it, so every frame of every file is contoured and
+    colored alike. config is modified: pass a copy to keep the original.
+
+    Returns:
+        str : summary of the scan for the log
+    """
+    import numpy as np
+
+    choice = config.auto_scale.strip().lower()
+    match = re.fullmatch(r'p(\d+(?:\.\d*)?)', choice)
+    if choice != 'max' and not (match and 0 < float(match.group(1)) <= 100):
+        raise ValueError(f"auto_scale must be 'max' or 'pNN' with 0 < NN <= 100, not {config.auto_scale!r}")
+    quantiles = [0.5, 0.9, 0.99, 0.999]
+    if choice != 'max':
+        quantiles.append(float(match.group(1)) / 100)
+    summary = scan_spray_files(config, files, tuple(dict.fromkeys(quantiles)), config.scan_chunk_frames)
+    value = summary['max'] if choice == 'max' else summary['quantiles'][quantiles[-1]]
+    lines = [f'Scanned {summary["frames"]} frames of {len(files)} file(s): '
+             f'min {summary["min"]:.4g}, max {summary["max"]:.4g}, {summary["active"]} active cells']
+    if summary['active']:
+        lines.append('  ' + ', '.join(f'p{q * 100:g} {v:.4g}' for q, v in summary['quantiles'].items()))
+    if value is None or value <= 0 or value <= config.kml_min_scale:
+        lines.append('  No value above the minimum scale, the scale is left unchanged')
+        return '\n'.join(lines) + '\n'
+    config.kml_static = True
+    config.kml_max_scale = nice_ceiling(value)
+    config.kml_level_values = np.linspace(config.kml_min_scale, config.kml_max_scale, config.kml_levels).tolist()
+    lines.append(f'  Static scale and {config.kml_levels} levels set to '
+                 f'{config.kml_min_scale:g} .. {config.kml_max_scale:g} ({choice})')
+    return '\n'.join(lines) + '\n'
+
+
+def active_threshold(config: SprayConfig) -> float:
+    """Frames whose scaled peak is not above this value are skipped."""
+    return config.kml_min_scale if config.auto_crop else 0
+
+
+def preview_spray_file(config: SprayConfig, file_path: str, levels: int = 20, max_cells: int = 200,
+                       method: str = 'max') -> dict | None:
+    """
+    Writes a coarse preview KML of the first frame of a Spray .nc file with active cells.
+
+    Args:
+        config : Spray configuration
+        file_path : the .nc file to read
+        levels, max_cells, method : see main.preview_grid
+
+    Returns:
+        dict : the main.preview_grid summary plus the frame number, or None when
+               no frame has active cells
+    """
+    import numpy as np
+    from netCDF4 import Dataset
+
+    import main
+
+    with Dataset(file_path) as ds:
+        concentration = ds.variables['concentration']
+        time_frames, _, _, nlat, nlon = concentration.shape
+        latitudes, longitudes, lat_slice, lon_slice = spray_domain(config, nlat, nlon)
+        specie, level = combinations(config)[0]
+        for t in range(time_frames):
+            progress.frame(t + 1, time_frames)
+            grid = aggregate_frame(concentration, t, [specie], [level], config.tot_specie, lat_slice, lon_slice)[0, 0]
+            peak = grid.max()
+            if peak is np.ma.masked or float(peak) * config.multiplier * config.kml_scale <= active_threshold(config):
+                continue
+            os.makedirs(config.kml_output_dir, exist_ok=True)
+            kml_file = Path(config.kml_output_dir) / f'{Path(file_path).stem}_{config.kml_variable}_preview.kml'
+            main.apply_configuration(spray_kml_params(config))
+            main.NAME = kml_file.stem
+            main.begin_report(kml_file)
+            Z = np.ma.filled(grid, 0).astype(float) * config.multiplier
+            summary = main.preview_grid(*main.prepare_grid(longitudes, latitudes, Z), kml_file,
+                                        levels, max_cells, method)
+            summary['frame'] = t + 1
+            return summary
+    return None
+
+
+def process_spray_file(config: SprayConfig, file_path: str) -> None:
+    """
+    Converts every time frame of a Spray .nc file into KML files.
+
+    Every (specie, level) combination of combinations(config) is extracted
+    from the same read of each frame. With species or vertical_levels lists
+    each combination is written to its own specie_<s>_level_<l> subfolder.
+
+    With reductions, frames are not written one by one: they are added to
+    WindowStatistics and every reduction_window hours (aligned to midnight
+    of the start date, 0 for the whole file) one KML per reduction is
+    written, named after the reduction and the window start.
+    Frame progress and messages go to the active progress reporter.
+
+    Args:
+        config : Spray configuration
+        file_path : the .nc file to read
+    """
+    import numpy as np
+    from netCDF4 import Dataset
+
+    # Read NetCDF file
+    ds = Dataset(file_path)
+    try:
+        # Frames are read one hyperslab at a time, never the whole variable
+        concentration = ds.variables['concentration']
+        conc_shape = concentration.shape
+
+        # Get dimensions
+        time_frames = conc_shape[0]
+        nlat = conc_shape[3]
+        nlon = conc_shape[4]
+
+        # Output folder of every (specie, level) combination
+        combos = combinations(config)
+        species = sorted({specie for specie, _ in combos})
+        levels = sorted({level for _, level in combos})
+        if config.species or config.vertical_levels:
+            folders = {combo: Path(config.kml_output_dir) / f'specie_{combo[0]}_level_{combo[1]}' for combo in combos}
+        else:
+            folders = {combos[0]: Path(config.kml_output_dir)}
+        variables = {combo: combo_variable(config, *combo) for combo in combos}
+        for folder in folders.values():
+            os.makedirs(folder, exist_ok=True)
+
+        # Get start time
+        start_time = datetime.strptime(config.date, '%Y-%m-%d %H:%M').timestamp()
+        good_time = datetime.strptime(config.date_after_good, '%Y-%m-%d %H:%M').timestamp()
+
+        # Coordinate vectors and cut_map window, shared by files on the same domain
+        latitudes, longitudes, lat_slice, lon_slice = spray_domain(config, nlat, nlon)
+
+        # Process each time frame
+        progress.log(f'Processing {time_frames} time frames...')
+
+        # Frames before the good time are skipped without being read
+        frame_times = [start_time + t * 3600 for t in range(time_frames)]
+        wanted = wanted_frames(config, time_frames)
+
+        # Values are summed and contoured in float32 when asked; coordinates stay float64
+        dtype = np.float32 if config.float32 else None
+
+        def read_frame(t):
+            return aggregate_frame(concentration, t, species, levels, config.tot_specie, lat_slice, lon_slice, dtype)
+
+        base_name = Path(file_path).stem
+        # Statistics of the current reduction window per combination
+        statistics = {}
+        window = None
+        midnight = datetime.fromtimestamp(start_time).replace(hour=0, minute=0).timestamp()
+
+        def window_of(timestamp):
+            return int((timestamp - midnight) // (config.reduction_window * 3600)) if config.reduction_window else 0
+
+        def write_window():
+            first = midnight + window * config.reduction_window * 3600 if config.reduction_window else window_start
+            label = datetime.fromtimestamp(first).strftime('%Y%m%d_%H%M')
+            for combo, stats in statistics.items():
+                for name, grid, scaled in stats.results():
+                    # Every map gets the whole frame time budget, not what the last frame left
+                    progress.restart(config.frame_timeout)
+                    try:
+                        params = list(spray_kml_params(config))
+                        params[1] = f'{variables[combo]} {name}'
+                        if not scaled:
+                            # Frame counts get their own static 0 to window frames scale, the same for every window
+                            params[0], params[5], params[6], params[7], params[11] = config.kml_levels, True, stats.frames, 0, 1
+                        new_kml = folders[combo] / f'{base_name}_{variables[combo]}_{name}_{label}.kml'
+                        grid_to_kml_configurated(longitudes, latitudes, grid, tuple(params), new_kml,
+                                                 auto_crop=config.auto_crop, output_mode=config.output_mode,
+                                                 shared_styles=config.shared_styles, reuse_frames=config.reuse_frames,
+                                                 frame_quantum=config.frame_quantum)
+                    except progress.FrameTimedOut as e:
+                        progress.record(e, f'window {label} {variables[combo]} {name}')
+                        progress.log(f'{Path(file_path).name} window {label} {variables[combo]} {name}: {e}')
+            progress.log(f'{Path(file_path).name} window {label}: {stats.frames} frames reduced')
+            statistics.clear()
+
+        frames = read_ahead(read_frame, wanted, config.prefetch_frames)
+        try:
+            for t in range(time_frames):
+                timestamp = frame_times[t]
+                readable_time = datetime.fromtimestamp(timestamp).strftime('%Y%m%d_%H%M')
+
+                # Update progress
+                progress.frame(t + 1, time_frames, config.frame_timeout)
+
+                # Skip if before good time
+                if config.cut_date and timestamp < good_time:
+                    continue
+                sums = next(frames)
+                if config.reductions:
+                    key = window_of(timestamp)
+                    if statistics and key != window:
+                        write_window()
+                    if not statistics:
+                        window, window_start = key, timestamp
+                    for combo in combos:
+                        Z = np.ma.filled(sums[species.index(combo[0]), levels.index(combo[1])], 0).astype(dtype or float)
+                        Z *= config.multiplier
+                        if combo not in statistics:
+                            statistics[combo] = WindowStatistics(config, Z.shape)
+                        statistics[combo].add(Z)
+                    continue
+                for index, (specie, level) in enumerate(combos):
+                    if index:
+                        # Every combination gets the whole frame time budget
+                        progress.restart(config.frame_timeout)
+                    try:
+                        grid = sums[species.index(specie), levels.index(level)]
+
+                        # Skip frames with no active cells before building the value grid
+                        peak = grid.max()
+                        if peak is np.ma.masked or float(peak) * config.multiplier * config.kml_scale <= active_threshold(config):
+                            continue
+
+                        Z = np.ma.filled(grid, 0).astype(dtype or float)
+                        Z *= config.multiplier
+                        # Generate KML with WGS84 coordinates
+                        params = list(spray_kml_params(config))
+                        params[1] = variables[specie, level]
+                        new_kml = folders[specie, level] / f'{base_name}_{variables[specie, level]}_{readable_time}.kml'
+                        grid_to_kml_configurated(longitudes, latitudes, Z, tuple(params), new_kml,
+                                                 auto_crop=config.auto_crop, output_mode=config.output_mode,
+                                                 shared_styles=config.shared_styles, reuse_frames=config.reuse_frames,
+                                                 frame_quantum=config.frame_quantum)
+                    except progress.FrameTimedOut as e:
+                        # Give up this combination of the frame only, the next one gets a fresh time budget
+                        progress.record(e, variables[specie, level])
+                        progress.log(f'{Path(file_path).name} frame {t + 1}/{time_frames} '
+                                     f'specie {specie} level {level}: {e}')
+                del sums
+            if statistics:
+                write_window()
+        finally:
+            # Stops the reader before the dataset is closed
+            frames.close()
+    finally:
+        ds.close()
+        # Documents kept for reuse_frames are only reused within a file
+        clear_rendered()